@@ -0,0 +1,56 @@
+import threading
+
+
+# Assez de connexions pour les déploiements et téléchargements en parallèle sans en ouvrir à chaque appel
+MAX_POOL_CONNECTIONS = 50
+MAX_ATTEMPTS = 10
+
+_lock = threading.Lock()
+_sessions = {}
+_clients = {}
+
+
+def get_session(profile=None):
+    # Les identifiants viennent de la chaîne standard (variables d'environnement, ~/.aws, rôle d'instance...)
+    import boto3
+
+    with _lock:
+        if profile not in _sessions:
+            _sessions[profile] = boto3.session.Session(profile_name=profile)
+        return _sessions[profile]
+
+
+def get_client(service, region=None, profile=None):
+    # Un client par service, région et profil, partagé entre les threads (les clients boto3 sont thread-safe,
+    # pas les sessions : leur création est protégée par le verrou)
+    from botocore.config import Config
+
+    key = (service, region, profile)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    session = get_session(profile)
+    with _lock:
+        if key not in _clients:
+            _clients[key] = session.client(
+                service,
+                region_name=region,
+                config=Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS,
+                    # Mode adaptatif : réessais avec limitation côté client quand l'API renvoie du throttling
+                    retries={"max_attempts": MAX_ATTEMPTS, "mode": "adaptive"},
+                ),
+            )
+        return _clients[key]
+
+
+_accounts = {}
+
+
+def get_account_id(region=None, profile=None):
+    # Compte des identifiants courants, résolu une seule fois par région et profil
+    key = (region, profile)
+    if key not in _accounts:
+        _accounts[key] = get_client("sts", region, profile).get_caller_identity()["Account"]
+    return _accounts[key]
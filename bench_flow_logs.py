@@ -0,0 +1,142 @@
+import argparse
+import gzip
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+
+from flow_aggregates import DEFAULT_COLUMNS, load_table, rejected_ports, top_talkers
+from flow_logs import parse_lines, read_parquet
+from flow_synth import FORMATS, generate_columns, write_file
+from security_group import classify_table
+from subnet_index import enrich_table, index_from_params
+
+
+DEFAULT_SIZES = [100_000, 1_000_000]
+REPORT_FILE = "bench_flow_logs.json"
+
+
+def _best_of(repeat, func):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _stage(name, seconds, records, size=None):
+    stage = {
+        "stage": name,
+        "seconds": seconds,
+        "records_per_second": records / seconds if seconds else None,
+    }
+    if size is not None:
+        stage["bytes"] = size
+        stage["bytes_per_second"] = size / seconds if seconds else None
+    return stage
+
+
+def _parse_text(path, columns=None):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return list(parse_lines(f, columns))
+
+
+def bench_size(directory, records, flow_format, repeat, seed):
+    # Mêmes données pour tous les formats : seuls le décodage et la quantité lue changent
+    columns = generate_columns(records, seed=seed)
+    fields = FORMATS[flow_format]
+    text_path = write_file(os.path.join(directory, f"{records}.log.gz"), columns, fields)
+    parquet_path = write_file(os.path.join(directory, f"{records}.log.parquet"), columns, fields, "parquet")
+    text_size = os.path.getsize(text_path)
+    parquet_size = os.path.getsize(parquet_path)
+    with gzip.open(text_path, "rb") as f:
+        raw_size = len(f.read())
+
+    wanted = set(DEFAULT_COLUMNS)
+    stages = []
+
+    seconds, _ = _best_of(repeat, lambda: _parse_text(text_path))
+    stages.append(_stage("parse_text", seconds, records, text_size))
+    stages[-1]["uncompressed_bytes_per_second"] = raw_size / seconds
+
+    seconds, _ = _best_of(repeat, lambda: _parse_text(text_path, wanted))
+    stages.append(_stage("parse_text_columns", seconds, records, text_size))
+
+    seconds, _ = _best_of(repeat, lambda: list(read_parquet(parquet_path)))
+    stages.append(_stage("parse_parquet", seconds, records, parquet_size))
+
+    seconds, parsed = _best_of(repeat, lambda: list(read_parquet(parquet_path, wanted)))
+    stages.append(_stage("parse_parquet_columns", seconds, records, parquet_size))
+
+    seconds, table = _best_of(repeat, lambda: load_table(parsed))
+    stages.append(_stage("load_table", seconds, records))
+
+    seconds, _ = _best_of(repeat, lambda: (top_talkers(table), rejected_ports(table)))
+    stages.append(_stage("aggregate", seconds, records))
+
+    seconds, _ = _best_of(repeat, lambda: classify_table(table))
+    stages.append(_stage("classify", seconds, records))
+
+    index = index_from_params()
+    seconds, _ = _best_of(repeat, lambda: enrich_table(table, index))
+    stages.append(_stage("enrich", seconds, records))
+
+    return {
+        "records": records,
+        "format": flow_format,
+        "gzip_bytes": text_size,
+        "uncompressed_bytes": raw_size,
+        "parquet_bytes": parquet_size,
+        "rejected": int(np.sum(columns["action"] == "REJECT")),
+        "stages": stages,
+    }
+
+
+def run(sizes=None, flow_format="v2", repeat=3, seed=0):
+    sizes = sizes or DEFAULT_SIZES
+    with tempfile.TemporaryDirectory() as directory:
+        results = [bench_size(directory, records, flow_format, repeat, seed) for records in sizes]
+
+    import pyarrow
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pyarrow": pyarrow.__version__,
+        "repeat": repeat,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de lecture et d'agrégation des flow logs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Nombres d'enregistrements")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="v2")
+    parser.add_argument("--repeat", type=int, default=3, help="Meilleur temps sur N répétitions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=REPORT_FILE)
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.format, args.repeat, args.seed)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'enregistrements':>15} {'étape':<22} {'enr./s':>12} {'Mo/s':>8}")
+    for r in report["results"]:
+        for stage in r["stages"]:
+            throughput = stage.get("bytes_per_second")
+            megabytes = f"{throughput / 1024 ** 2:>8.1f}" if throughput else f"{'':>8}"
+            print(f"{r['records']:>15} {stage['stage']:<22} {stage['records_per_second']:>12,.0f} {megabytes}")
+    print(f"Rapport écrit dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+import troposphere
+
+import network
+from cloud_watch_3_2 import build_cloudwatch_template
+from nested_stacks import unbounded_templates
+
+
+DEFAULT_COUNTS = [2, 6, 20, 100]
+REPORT_FILE = "bench_templates.json"
+
+
+def build_scaled_topology(count):
+    # Le fragment réseau est mémoïsé : on vide le cache pour mesurer une construction complète
+    network._build_network.cache_clear()
+    return build_cloudwatch_template({"AZCount": count})
+
+
+def _best_of(repeat, func):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_count(count, repeat):
+    build_time, template = _best_of(repeat, lambda: build_scaled_topology(count))
+    yaml_time, yaml_body = _best_of(repeat, template.to_yaml)
+    json_time, json_body = _best_of(repeat, template.to_json)
+
+    # Mesures mémoire séparées : tracemalloc ralentit fortement l'exécution et fausserait les temps
+    return {
+        "count": count,
+        "resources": len(template.resources),
+        "outputs": len(template.outputs),
+        "build_seconds": build_time,
+        "to_yaml_seconds": yaml_time,
+        "to_json_seconds": json_time,
+        "yaml_bytes": len(yaml_body.encode("utf-8")),
+        "json_bytes": len(json_body.encode("utf-8")),
+        "build_peak_bytes": _peak_memory(lambda: build_scaled_topology(count)),
+        "to_yaml_peak_bytes": _peak_memory(template.to_yaml),
+        "to_json_peak_bytes": _peak_memory(template.to_json),
+        "exceeds_resource_limit": len(template.resources) > 500,
+        "exceeds_output_limit": len(template.outputs) > 200,
+    }
+
+
+def run(counts=None, repeat=3):
+    counts = counts or DEFAULT_COUNTS
+
+    # Les limites CloudFormation sont levées pour mesurer la génération elle-même ; le dépassement est
+    # signalé dans le rapport
+    with unbounded_templates():
+        results = [bench_count(count, repeat) for count in counts]
+
+    return {
+        "python": platform.python_version(),
+        "troposphere": troposphere.__version__,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de génération des templates")
+    parser.add_argument("--counts", type=int, nargs="+", default=DEFAULT_COUNTS, help="Nombres d'AZ à mesurer")
+    parser.add_argument("--repeat", type=int, default=3, help="Meilleur temps sur N répétitions")
+    parser.add_argument("--output", default=REPORT_FILE)
+    args = parser.parse_args()
+
+    report = run(args.counts, args.repeat)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'AZ':>5} {'ressources':>10} {'build (ms)':>11} {'yaml (ms)':>10} {'json (ms)':>10} {'pic (Ko)':>9}")
+    for r in report["results"]:
+        peak = max(r["build_peak_bytes"], r["to_yaml_peak_bytes"], r["to_json_peak_bytes"])
+        print(f"{r['count']:>5} {r['resources']:>10} {r['build_seconds'] * 1000:>11.1f} "
+              f"{r['to_yaml_seconds'] * 1000:>10.1f} {r['to_json_seconds'] * 1000:>10.1f} {peak / 1024:>9.0f}")
+    print(f"Rapport écrit dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+from troposphere.s3 import (
+    AbortIncompleteMultipartUpload,
+    AccelerateConfiguration,
+    LifecycleConfiguration,
+    LifecycleRule,
+    LifecycleRuleTransition,
+    NoncurrentVersionExpiration,
+)
+
+
+# baseline : SSE-KMS et versioning seuls (templates inchangés)
+# optimized : S3 Bucket Keys et règles de cycle de vie, accélération des transferts en option
+BUCKET_PROFILES = ("baseline", "optimized")
+DEFAULT_BUCKET_PROFILE = "baseline"
+
+
+def bucket_profile(params):
+    profile = params.get("BucketProfile", DEFAULT_BUCKET_PROFILE)
+    if profile not in BUCKET_PROFILES:
+        raise ValueError(f"BucketProfile doit être l'un de {', '.join(BUCKET_PROFILES)}")
+    return profile
+
+
+def lifecycle_configuration(params):
+    # Versions non courantes supprimées après NoncurrentVersionExpirationDays (sinon elles s'accumulent sans
+    # fin), téléversements multipart abandonnés nettoyés, objets courants passés en Intelligent-Tiering
+    rule = LifecycleRule(
+        Id="BucketProfile",
+        Status="Enabled",
+        Prefix="",
+        NoncurrentVersionExpiration=NoncurrentVersionExpiration(
+            NoncurrentDays=params.get("NoncurrentVersionExpirationDays", 30)
+        ),
+        AbortIncompleteMultipartUpload=AbortIncompleteMultipartUpload(
+            DaysAfterInitiation=params.get("AbortMultipartUploadDays", 7)
+        ),
+        # Marqueurs de suppression restés seuls une fois leurs versions expirées
+        ExpiredObjectDeleteMarker=True,
+    )
+    if params.get("IntelligentTiering", True):
+        rule.Transitions = [
+            LifecycleRuleTransition(
+                StorageClass="INTELLIGENT_TIERING",
+                TransitionInDays=params.get("IntelligentTieringDays", 0),
+            )
+        ]
+    return LifecycleConfiguration(Rules=[rule])
+
+
+def apply_bucket_profile(bucket, params):
+    # Même profil pour tous les buckets d'un template (source, réplique, logs)
+    if bucket_profile(params) == "baseline":
+        return bucket
+
+    # Bucket Keys : une clé de données par bucket, réutilisée, au lieu d'un appel KMS par opération sur un objet
+    for rule in bucket.BucketEncryption.ServerSideEncryptionConfiguration:
+        rule.BucketKeyEnabled = True
+
+    bucket.LifecycleConfiguration = lifecycle_configuration(params)
+
+    if params.get("TransferAcceleration", False):
+        bucket.AccelerateConfiguration = AccelerateConfiguration(AccelerationStatus="Enabled")
+    return bucket
@@ -0,0 +1,92 @@
+import threading
+import time
+
+
+# Plusieurs stacks peuvent être mises à jour en parallèle : une seule question à la fois dans le terminal
+_prompt_lock = threading.Lock()
+
+
+def ask_approval(stack_name, changes):
+    with _prompt_lock:
+        print(format_changes(stack_name, changes))
+        answer = input(f"Exécuter le change set sur {stack_name} ? [o/N] ")
+    return answer.strip().lower() in ("o", "oui", "y", "yes")
+
+
+def auto_approve(stack_name, changes):
+    print(format_changes(stack_name, changes))
+    return True
+
+
+def summarize_changes(response):
+    changes = []
+    for change in response.get("Changes", []):
+        resource = change["ResourceChange"]
+        changes.append({
+            "action": resource["Action"],
+            "logical_id": resource["LogicalResourceId"],
+            "type": resource["ResourceType"],
+            # "True" : ressource recréée ; "Conditional" : dépend de valeurs connues seulement à l'exécution
+            "replacement": resource.get("Replacement", "False"),
+        })
+    return changes
+
+
+def format_changes(stack_name, changes):
+    lines = [f"Change set pour {stack_name} :"]
+    for change in changes:
+        if change["action"] != "Modify":
+            kind = change["action"]
+        elif change["replacement"] == "True":
+            kind = "Remplacement"
+        elif change["replacement"] == "Conditional":
+            kind = "Remplacement conditionnel"
+        else:
+            kind = "Modification en place"
+        lines.append(f"  {kind:<26} {change['logical_id']} ({change['type']})")
+    return "\n".join(lines)
+
+
+def update_with_change_set(cf_client, stack_kwargs, approve=ask_approval, wait=False):
+    # Retourne "updated", "unchanged" ou "rejected"
+    stack_name = stack_kwargs["StackName"]
+    change_set_name = f"{stack_name}-{int(time.time())}"
+
+    cf_client.create_change_set(
+        ChangeSetName=change_set_name,
+        ChangeSetType="UPDATE",
+        **stack_kwargs,
+    )
+
+    from botocore.exceptions import WaiterError
+
+    try:
+        cf_client.get_waiter("change_set_create_complete").wait(
+            StackName=stack_name,
+            ChangeSetName=change_set_name,
+            WaiterConfig={"Delay": 5},
+        )
+    except WaiterError:
+        response = cf_client.describe_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+        reason = response.get("StatusReason", "")
+        # Changement de hash sans effet réel (ex. : ordre des clés) : CloudFormation refuse le change set vide
+        if "didn't contain changes" in reason or "No updates are to be performed" in reason:
+            cf_client.delete_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+            return "unchanged"
+        raise
+
+    response = cf_client.describe_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+    changes = summarize_changes(response)
+
+    if not approve(stack_name, changes):
+        cf_client.delete_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+        print(f"Change set {change_set_name} refusé et supprimé")
+        return "rejected"
+
+    cf_client.execute_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+    print(f"Mise à jour du stack {stack_name} en cours...")
+
+    if wait:
+        cf_client.get_waiter("stack_update_complete").wait(StackName=stack_name)
+
+    return "updated"
@@ -0,0 +1,198 @@
+import argparse
+import codecs
+import datetime
+import gzip
+import json
+import re
+
+import object_cache
+from aws_clients import get_account_id, get_client
+from flow_logs import fetch_concurrently
+
+
+# Bucket dédié créé par s3_3_3_2.py (TrailLogBucket)
+DEFAULT_BUCKET = "polystudentsbucket-trail-logs"
+TRAIL_NAME = "S3ActivityTrail"
+
+OBJECT_SUFFIX = ".json.gz"
+
+# Champs des événements produits : un tuple par événement, bien plus léger que l'enregistrement JSON complet
+EVENT_FIELDS = ("time", "principal", "action", "bucket", "key", "source_ip")
+
+# Taille des blocs décompressés passés au décodeur : un seul enregistrement décodé à la fois, le reste du
+# fichier n'est jamais en mémoire
+CHUNK_SIZE = 1024 * 1024
+
+_RECORDS_START = re.compile(r'"Records"\s*:\s*\[')
+_SEPARATORS = re.compile(r"[\s,]*")
+
+
+def _logs_root(account, key_prefix=""):
+    # S3KeyPrefix du trail (TrailS3KeyPrefix), puis l'arborescence standard de CloudTrail
+    return f"{key_prefix}/AWSLogs/{account}/CloudTrail/" if key_prefix else f"AWSLogs/{account}/CloudTrail/"
+
+
+def region_prefixes(s3_client, bucket, account, key_prefix=""):
+    # Trail multi-régions : une arborescence par région, découverte en listant un seul niveau
+    paginator = s3_client.get_paginator("list_objects_v2")
+    prefix = _logs_root(account, key_prefix)
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+        for common in page.get("CommonPrefixes", []):
+            yield common["Prefix"][len(prefix):].rstrip("/")
+
+
+def partition_prefixes(account, regions, start, end, key_prefix=""):
+    # Un préfixe par région et par jour (bornes incluses) ; les fichiers de condensat (CloudTrail-Digest) sont
+    # dans une autre arborescence et ne sont jamais listés
+    for region in regions:
+        day = start
+        while day <= end:
+            yield f"{_logs_root(account, key_prefix)}{region}/{day:%Y/%m/%d}/"
+            day += datetime.timedelta(days=1)
+
+
+def list_objects(s3_client, bucket, prefixes):
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for prefix in prefixes:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                if obj["Key"].endswith(OBJECT_SUFFIX):
+                    yield obj
+
+
+def iter_records(chunks):
+    # Décode un à un les éléments du tableau "Records" d'un document {"Records": [...]} reçu par blocs
+    # d'octets. Le tampon ne garde que la partie pas encore décodée
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    in_records = False
+
+    chunks = iter(chunks)
+    eof = False
+    while not eof:
+        chunk = next(chunks, None)
+        eof = chunk is None
+        buffer = buffer[position:] + text.decode(b"" if eof else chunk, final=eof)
+        position = 0
+
+        if not in_records:
+            match = _RECORDS_START.search(buffer)
+            if match is None:
+                continue
+            position = match.end()
+            in_records = True
+
+        while True:
+            position = _SEPARATORS.match(buffer, position).end()
+            if position >= len(buffer):
+                break
+            if buffer[position] == "]":
+                return
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Enregistrement coupé en fin de bloc : on attend le bloc suivant
+                if eof:
+                    raise
+                break
+            yield record
+
+
+def slim_event(record):
+    # (heure, principal, action, bucket, clé, IP source). Le principal est l'ARN de l'identité (session de rôle
+    # comprise), ou le service AWS à l'origine de l'appel
+    identity = record.get("userIdentity") or {}
+    parameters = record.get("requestParameters") or {}
+    return (
+        record.get("eventTime"),
+        identity.get("arn") or identity.get("invokedBy") or identity.get("principalId"),
+        record.get("eventName"),
+        parameters.get("bucketName"),
+        parameters.get("key"),
+        record.get("sourceIPAddress"),
+    )
+
+
+def events(chunks, actions=None):
+    for record in iter_records(chunks):
+        if actions is None or record.get("eventName") in actions:
+            yield slim_event(record)
+
+
+def _read_chunks(stream):
+    return iter(lambda: stream.read(CHUNK_SIZE), b"")
+
+
+def _mapped_chunks(data):
+    for start in range(0, len(data), CHUNK_SIZE):
+        yield data[start:start + CHUNK_SIZE]
+
+
+def read_object(s3_client, bucket, key, actions=None):
+    body = s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+    try:
+        # Décompression et décodage au fil de l'eau
+        with gzip.GzipFile(fileobj=body) as raw:
+            yield from events(_read_chunks(raw), actions)
+    finally:
+        body.close()
+
+
+def read_cached_object(s3_client, bucket, key, etag=None, actions=None):
+    with object_cache.open_object(s3_client, bucket, key, etag, gunzip=True) as data:
+        yield from events(_mapped_chunks(data), actions)
+
+
+def read_trail_logs(s3_client, bucket, keys, max_workers=8, actions=None, cache=False):
+    # keys : clés S3, ou objets de list_objects (leur ETag évite un HEAD par objet avec le cache local)
+    def read(item):
+        key, etag = (item["Key"], item.get("ETag")) if isinstance(item, dict) else (item, None)
+        if cache:
+            return read_cached_object(s3_client, bucket, key, etag, actions)
+        return read_object(s3_client, bucket, key, actions)
+
+    return fetch_concurrently(read, keys, max_workers)
+
+
+def scan(bucket, start, end, account=None, regions=None, region=None, max_workers=8, actions=None, cache=False,
+         key_prefix=""):
+    s3_client = get_client("s3", region)
+    if account is None:
+        account = get_account_id(region)
+    if regions is None:
+        regions = list(region_prefixes(s3_client, bucket, account, key_prefix))
+
+    prefixes = partition_prefixes(account, regions, start, end, key_prefix)
+    return read_trail_logs(s3_client, bucket, list_objects(s3_client, bucket, prefixes), max_workers, actions, cache)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Lecture des logs CloudTrail ({TRAIL_NAME}) livrés dans S3")
+    parser.add_argument("--bucket", default=DEFAULT_BUCKET)
+    parser.add_argument("--key-prefix", default="", help="S3KeyPrefix du trail (TrailS3KeyPrefix)")
+    parser.add_argument("--account")
+    parser.add_argument("--region", help="Région du client S3")
+    parser.add_argument("--regions", nargs="+", help="Régions du trail à lire (par défaut : toutes celles livrées)")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--actions", nargs="+", help="Noms d'événements à garder (ex. : GetObject DeleteObject)")
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--cache", action="store_true", help=f"Copie locale des objets dans {object_cache.CACHE_DIR}")
+    args = parser.parse_args()
+
+    counts = {}
+    records = scan(
+        args.bucket, args.start, args.end, args.account, args.regions, args.region, args.max_workers,
+        actions=set(args.actions) if args.actions else None, cache=args.cache, key_prefix=args.key_prefix,
+    )
+    for _, principal, action, _, _, _ in records:
+        counts[(action, principal)] = counts.get((action, principal), 0) + 1
+
+    for (action, principal), count in sorted(counts.items(), key=lambda item: -item[1]):
+        print(f"{count:>10} {action} {principal}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cloud_watch_3_2
+import s3
+import s3_3_3
+import s3_3_3_2
+import vpc
+import vpc_flow_logs
+from aws_clients import get_client
+from change_sets import ask_approval, auto_approve
+from deploy_cache import deploy_if_changed, load_cache
+from nested_stacks import exceeds_limits, split_template, unbounded_templates
+from template_delivery import nested_template_url, render_body
+
+
+# Graphe des stacks : nom de la stack -> module, fonction de génération (qui reçoit les options --param) et
+# dépendances. Les trois variantes S3 créent toutes polystudentsbucket : on n'en déploie qu'une à la fois.
+# Les trois variantes VPC créent chacune leur propre VPC avec une NAT gateway (et une EIP) par AZ : les
+# déployer ensemble demande 6 EIP avec les 2 AZ par défaut, au-delà du quota par défaut de 5 par région.
+STACKS = {
+    s3.STACK_NAME: {
+        "module": s3,
+        "builder": "create_s3_template",
+        "depends_on": [],
+        "capabilities": [],
+    },
+    s3_3_3.STACK_NAME: {
+        "module": s3_3_3,
+        "builder": "create_s3_template",
+        "depends_on": [],
+        "capabilities": ["CAPABILITY_IAM"],
+    },
+    s3_3_3_2.STACK_NAME: {
+        "module": s3_3_3_2,
+        "builder": "create_s3_template",
+        "depends_on": [],
+        "capabilities": ["CAPABILITY_IAM"],
+    },
+    vpc.STACK_NAME: {
+        "module": vpc,
+        "builder": "build_vpc_template",
+        "depends_on": [],
+        "capabilities": [],
+    },
+    # Les flow logs sont livrés dans polystudentsbucket, qui doit exister avant
+    vpc_flow_logs.STACK_NAME: {
+        "module": vpc_flow_logs,
+        "builder": "build_flow_logs_template",
+        "depends_on": [s3.STACK_NAME],
+        "capabilities": ["CAPABILITY_IAM"],
+    },
+    cloud_watch_3_2.STACK_NAME: {
+        "module": cloud_watch_3_2,
+        "builder": "build_cloudwatch_template",
+        "depends_on": [],
+        "capabilities": [],
+    },
+}
+
+# Une seule variante VPC par défaut : celle avec les flow logs, livrés dans le bucket de s3-secure-bucket-stack
+DEFAULT_STACKS = [s3.STACK_NAME, vpc_flow_logs.STACK_NAME]
+
+
+def build_template(stack_name, params=None, template_url=None):
+    # Retourne le template à déployer et, s'il a fallu le découper, les corps de ses stacks imbriquées
+    spec = STACKS[stack_name]
+    builder = getattr(spec["module"], spec["builder"])
+
+    with unbounded_templates():
+        template = builder(params)
+
+    if not exceeds_limits(template.to_dict()):
+        return template, {}
+    if template_url is None:
+        raise ValueError(f"{stack_name} dépasse les limites CloudFormation : un bucket de staging est nécessaire")
+    return split_template(template, template_url)
+
+
+def topological_order(stack_names):
+    # Tri topologique ; les dépendances hors sélection sont considérées déjà déployées
+    selected = set(stack_names)
+    order = []
+    state = {}
+
+    def visit(name):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Dépendance circulaire détectée sur la stack {name}")
+        state[name] = "visiting"
+        for dep in STACKS[name]["depends_on"]:
+            if dep in selected:
+                visit(dep)
+        state[name] = "done"
+        order.append(name)
+
+    for name in stack_names:
+        if name not in STACKS:
+            raise KeyError(f"Stack inconnue : {name}")
+        visit(name)
+    return order
+
+
+def deploy_stack(cf_client, stack_name, template, cache, approve, s3_client=None, staging_bucket=None,
+                 nested_templates=None):
+    spec = STACKS[stack_name]
+    start = time.perf_counter()
+
+    action = deploy_if_changed(
+        cf_client,
+        stack_name,
+        template,
+        capabilities=spec["capabilities"],
+        cache=cache,
+        wait=True,
+        approve=approve,
+        s3_client=s3_client,
+        staging_bucket=staging_bucket,
+        nested_templates=nested_templates,
+    )
+
+    elapsed = time.perf_counter() - start
+    if action in ("created", "updated"):
+        print(f"Stack {stack_name} déployée en {elapsed:.1f} s")
+    return elapsed
+
+
+def deploy_all(cf_client, stack_names=None, max_workers=None, approve=ask_approval, s3_client=None,
+               staging_bucket=None, params=None):
+    order = topological_order(stack_names or DEFAULT_STACKS)
+    selected = set(order)
+
+    # Génération des templates avant tout appel AWS : une erreur de template ne laisse rien à moitié déployé
+    templates = {}
+    for name in order:
+        template_url = nested_template_url(s3_client, staging_bucket, name) if staging_bucket else None
+        templates[name] = build_template(name, params, template_url)
+    cache = load_cache()
+
+    futures = {}
+
+    def run(name):
+        for dep in STACKS[name]["depends_on"]:
+            if dep in selected:
+                futures[dep].result()
+        template, nested_templates = templates[name]
+        return deploy_stack(cf_client, name, template, cache, approve, s3_client, staging_bucket, nested_templates)
+
+    start = time.perf_counter()
+    # Soumission dans l'ordre topologique : une tâche n'attend jamais une stack pas encore démarrée
+    with ThreadPoolExecutor(max_workers=max_workers or len(order)) as executor:
+        for name in order:
+            futures[name] = executor.submit(run, name)
+        durations = {name: futures[name].result() for name in order}
+    wall_clock = time.perf_counter() - start
+
+    serial = sum(durations.values())
+    print(f"Temps total (parallèle) : {wall_clock:.1f} s")
+    print(f"Temps estimé en série : {serial:.1f} s")
+    if wall_clock > 0:
+        print(f"Accélération : x{serial / wall_clock:.2f}")
+
+    return {"durations": durations, "wall_clock": wall_clock, "serial": serial}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Déploiement parallèle des stacks du TP4")
+    parser.add_argument("stacks", nargs="*", help=f"Stacks à déployer (défaut : {', '.join(DEFAULT_STACKS)})")
+    parser.add_argument("--max-workers", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="Génère les templates sans appeler AWS")
+    parser.add_argument("--region", help="Région AWS (défaut : configuration AWS standard)")
+    parser.add_argument("--az-count", type=int, help="Nombre d'AZ des stacks VPC")
+    parser.add_argument("--param", action="append", default=[], metavar="CLE=VALEUR",
+                        help="Option passée aux builders paramétrables (ex. : FlowLogFileFormat=parquet)")
+    parser.add_argument("--staging-bucket", help="Bucket S3 pour les templates trop gros pour TemplateBody")
+    parser.add_argument("--yes", action="store_true", help="Exécute les change sets sans demander de confirmation")
+    args = parser.parse_args()
+
+    stack_names = args.stacks or DEFAULT_STACKS
+    params = {}
+    if args.az_count:
+        params["AZCount"] = args.az_count
+    for option in args.param:
+        key, _, value = option.partition("=")
+        # Les booléens et nombres sont écrits en JSON (true, 3), le reste est gardé tel quel
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+
+    if args.dry_run:
+        for name in topological_order(stack_names):
+            template, nested_templates = build_template(name, params, lambda nested_name, body: nested_name)
+            body = render_body(template)
+            print(f"{name} : {len(body.encode('utf-8'))} octets")
+            for nested_name, nested_body in nested_templates.items():
+                print(f"  {nested_name} : {len(nested_body.encode('utf-8'))} octets")
+        return
+
+    cf_client = get_client('cloudformation', args.region)
+    s3_client = get_client('s3', args.region)
+
+    deploy_all(
+        cf_client,
+        stack_names,
+        max_workers=args.max_workers,
+        approve=auto_approve if args.yes else ask_approval,
+        s3_client=s3_client,
+        staging_bucket=args.staging_bucket,
+        params=params,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import threading
+
+from aws_clients import get_account_id
+from change_sets import ask_approval, update_with_change_set
+from template_delivery import render_body, template_source, upload_nested
+
+
+CACHE_FILE = ".deploy_cache.json"
+
+# États dans lesquels le template déployé reflète réellement la stack
+STABLE_STATUSES = {"CREATE_COMPLETE", "UPDATE_COMPLETE", "UPDATE_ROLLBACK_COMPLETE", "IMPORT_COMPLETE"}
+
+_lock = threading.Lock()
+
+
+def _canonical_body(body):
+    # Un même template JSON doit toujours donner le même hash, peu importe l'indentation
+    if isinstance(body, dict):
+        return json.dumps(body, sort_keys=True, separators=(",", ":"))
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        return body
+
+
+def template_hash(body, parameters=None):
+    digest = hashlib.sha256(_canonical_body(body).encode("utf-8"))
+    digest.update(json.dumps(parameters or {}, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_cache(path=CACHE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_cache(cache, path=CACHE_FILE):
+    with _lock:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+def cache_key(cf_client, stack_name, account=None):
+    # Une même stack peut exister dans plusieurs comptes et régions : chacune a sa propre entrée
+    region = cf_client.meta.region_name
+    account = account or get_account_id(region)
+    return f"{account}/{region}/{stack_name}"
+
+
+def record(cache, key, digest, path=CACHE_FILE):
+    with _lock:
+        cache[key] = digest
+    save_cache(cache, path)
+
+
+def describe_stack(cf_client, stack_name):
+    from botocore.exceptions import ClientError
+
+    try:
+        return cf_client.describe_stacks(StackName=stack_name)["Stacks"][0]
+    except ClientError as e:
+        if "does not exist" in str(e):
+            return None
+        raise
+
+
+def deployed_hash(cf_client, stack, parameters=None):
+    if stack["StackStatus"] not in STABLE_STATUSES:
+        return None
+
+    body = cf_client.get_template(StackName=stack["StackName"], TemplateStage="Original")["TemplateBody"]
+    # On ne compare que les paramètres que l'on passe nous-mêmes ; les autres gardent leur valeur par défaut
+    deployed_parameters = {
+        p["ParameterKey"]: p["ParameterValue"]
+        for p in stack.get("Parameters", [])
+        if p["ParameterKey"] in (parameters or {})
+    }
+    return template_hash(body, deployed_parameters)
+
+
+def deploy_if_changed(cf_client, stack_name, template, parameters=None, capabilities=None, cache=None, wait=False,
+                      approve=ask_approval, s3_client=None, staging_bucket=None, nested_templates=None, account=None):
+    # Retourne "skipped", "created", "updated" ou "rejected" ; nested_templates : corps des stacks imbriquées
+    # référencées par template, téléversés seulement si la stack doit être déployée
+    body = render_body(template)
+    digest = template_hash(body, parameters)
+    key = cache_key(cf_client, stack_name, account)
+
+    if cache is None:
+        cache = load_cache()
+
+    # Cache local : aucun appel AWS (hormis l'identité du compte) si rien n'a changé depuis le dernier
+    # déploiement réussi dans ce compte et cette région
+    if cache.get(key) == digest:
+        print(f"Stack {stack_name} inchangée (cache local), rien à faire")
+        return "skipped"
+
+    stack = describe_stack(cf_client, stack_name)
+    if stack is not None and stack["StackStatus"] == "ROLLBACK_COMPLETE":
+        # Création échouée : la stack ne contient plus aucune ressource et CloudFormation refuse de la mettre à
+        # jour. On la supprime pour la recréer
+        print(f"Stack {stack_name} en ROLLBACK_COMPLETE : suppression avant recréation")
+        cf_client.delete_stack(StackName=stack_name)
+        cf_client.get_waiter("stack_delete_complete").wait(StackName=stack_name)
+        stack = None
+
+    if stack is not None and deployed_hash(cf_client, stack, parameters) == digest:
+        print(f"Stack {stack_name} inchangée (template déployé identique), rien à faire")
+        record(cache, key, digest)
+        return "skipped"
+
+    kwargs = {
+        "StackName": stack_name,
+        "Capabilities": capabilities or [],
+        **template_source(stack_name, body, s3_client, staging_bucket),
+    }
+    if nested_templates:
+        upload_nested(s3_client, staging_bucket, stack_name, nested_templates)
+    if parameters:
+        kwargs["Parameters"] = [{"ParameterKey": k, "ParameterValue": v} for k, v in parameters.items()]
+
+    if stack is None:
+        cf_client.create_stack(**kwargs)
+        print(f"Déploiement du stack {stack_name} en cours...")
+        if wait:
+            cf_client.get_waiter("stack_create_complete").wait(StackName=stack_name)
+        action = "created"
+    else:
+        # Mise à jour incrémentale : on montre ce qui sera remplacé avant de toucher à la stack
+        action = update_with_change_set(cf_client, kwargs, approve=approve, wait=wait)
+        if action == "rejected":
+            return action
+        if action == "unchanged":
+            action = "skipped"
+
+    # Sans attente, on ne peut pas savoir si le déploiement réussira : le cache local n'est mis à jour qu'après
+    # succès, et la comparaison avec le template déployé prendra le relais au prochain lancement
+    if wait or action == "skipped":
+        record(cache, key, digest)
+
+    return action
@@ -0,0 +1,234 @@
+import argparse
+import datetime
+import time
+
+import numpy as np
+
+from flow_logs import DEFAULT_BUCKET, scan
+from subnet_index import enrich_table, index_from_params
+
+
+# Fenêtre d'agrégation par défaut, en secondes (10 minutes, comme MaxAggregationInterval)
+DEFAULT_WINDOW = 600
+
+# Valeur des champs numériques absents ("-" dans les logs, ex. : NODATA)
+MISSING = -1
+
+# Colonnes numériques chargées telles quelles ; les autres (adresses, action...) sont factorisées en codes
+NUMERIC_COLUMNS = {
+    "version": np.int16,
+    "srcport": np.int32,
+    "dstport": np.int32,
+    "protocol": np.int16,
+    "packets": np.int64,
+    "bytes": np.int64,
+    "start": np.int64,
+    "end": np.int64,
+    "tcp-flags": np.int32,
+}
+DEFAULT_COLUMNS = ("srcaddr", "dstaddr", "dstport", "protocol", "packets", "bytes", "start", "action")
+
+# Enregistrements convertis en tableaux par paquet, pour ne pas garder des millions de dicts en mémoire
+CHUNK_SIZE = 500_000
+
+PROTOCOLS = {1: "icmp", 6: "tcp", 17: "udp"}
+
+
+def _numeric_chunk(chunk, name, dtype):
+    return np.array([MISSING if r.get(name) is None else r[name] for r in chunk], dtype=dtype)
+
+
+def _categorical_chunk(chunk, name, index):
+    # Chaque valeur distincte reçoit un code entier, dans l'ordre d'apparition
+    return np.array([index.setdefault(r.get(name), len(index)) for r in chunk], dtype=np.int32)
+
+
+def load_table(records, columns=DEFAULT_COLUMNS, chunk_size=CHUNK_SIZE):
+    # Charge des enregistrements (dicts de flow_logs) en colonnes NumPy. Retourne un dict avec "size",
+    # "columns" (un tableau par champ) et "categories" (valeurs des champs factorisés, indexées par code)
+    indexes = {name: {} for name in columns if name not in NUMERIC_COLUMNS}
+    parts = {name: [] for name in columns}
+
+    def flush(chunk):
+        for name in columns:
+            if name in NUMERIC_COLUMNS:
+                parts[name].append(_numeric_chunk(chunk, name, NUMERIC_COLUMNS[name]))
+            else:
+                parts[name].append(_categorical_chunk(chunk, name, indexes[name]))
+
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk or not parts[columns[0]]:
+        flush(chunk)
+
+    arrays = {name: np.concatenate(chunks) for name, chunks in parts.items()}
+    return {
+        "size": len(arrays[columns[0]]),
+        "columns": arrays,
+        "categories": {name: np.array(list(index), dtype=object) for name, index in indexes.items()},
+    }
+
+
+def code_of(table, name, value):
+    # Code d'une valeur d'un champ factorisé, ou -1 si elle n'apparaît pas (aucun enregistrement ne correspond)
+    matches = np.flatnonzero(table["categories"][name] == value)
+    return int(matches[0]) if len(matches) else -1
+
+
+def where(table, **conditions):
+    # Masque booléen des enregistrements dont les champs valent les valeurs données (ex. : action="REJECT")
+    mask = np.ones(table["size"], dtype=bool)
+    for name, value in conditions.items():
+        name = name.replace("_", "-")
+        if name in table["categories"]:
+            value = code_of(table, name, value)
+        mask &= table["columns"][name] == value
+    return mask
+
+
+def _key_column(table, key, window):
+    if key == "window":
+        start = table["columns"]["start"]
+        return np.where(start >= 0, start // window * window, MISSING)
+    return table["columns"][key]
+
+
+def aggregate(table, keys, mask=None, window=DEFAULT_WINDOW):
+    # Group-by vectorisé : chaque clé est réduite à ses valeurs distinctes, puis les indices sont combinés en
+    # un seul entier par enregistrement (base mixte) que np.unique regroupe en une passe.
+    # "window" est une clé virtuelle : début de la fenêtre de `window` secondes contenant `start`
+    selected = slice(None) if mask is None else mask
+    uniques = []
+    inverses = []
+    for key in keys:
+        values, inverse = np.unique(_key_column(table, key, window)[selected], return_inverse=True)
+        uniques.append(values)
+        inverses.append(inverse.reshape(-1).astype(np.int64))
+
+    shape = tuple(len(values) for values in uniques)
+    if np.prod(shape, dtype=float) < 2 ** 63:
+        combined = np.ravel_multi_index(inverses, shape)
+        groups, inverse = np.unique(combined, return_inverse=True)
+        positions = np.unravel_index(groups, shape)
+    else:
+        # Trop de combinaisons pour un entier 64 bits : regroupement sur les lignes de la matrice des indices
+        rows, inverse = np.unique(np.stack(inverses, axis=1), axis=0, return_inverse=True)
+        positions = tuple(rows.T)
+    inverse = inverse.reshape(-1)
+
+    result = {
+        "keys": {key: uniques[i][positions[i]] for i, key in enumerate(keys)},
+        "flows": np.bincount(inverse, minlength=len(positions[0])),
+    }
+    for name in ("packets", "bytes"):
+        if name in table["columns"]:
+            values = table["columns"][name][selected]
+            result[name] = np.bincount(inverse, weights=np.maximum(values, 0), minlength=len(result["flows"]))
+            result[name] = result[name].astype(np.int64)
+    return result
+
+
+def top_per_group(result, group_key, n, by="flows"):
+    # Indices des n meilleures lignes de chaque groupe (ex. : par fenêtre), triés par groupe puis par valeur
+    groups = result["keys"][group_key]
+    order = np.lexsort((-result[by], groups))
+    sorted_groups = groups[order]
+    starts = np.r_[0, np.flatnonzero(sorted_groups[1:] != sorted_groups[:-1]) + 1]
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    return order[rank < n]
+
+
+def rows(table, result, indexes):
+    # Lignes du résultat en dicts, avec les codes des champs factorisés remplacés par leurs valeurs
+    for i in indexes:
+        row = {}
+        for key, values in result["keys"].items():
+            value = values[i]
+            row[key] = table["categories"][key][value] if key in table["categories"] else int(value)
+        for name in ("flows", "packets", "bytes"):
+            if name in result:
+                row[name] = int(result[name][i])
+        yield row
+
+
+def top_talkers(table, n=10, action="REJECT", window=DEFAULT_WINDOW):
+    # Adresses sources les plus actives (par défaut : les plus rejetées) de chaque fenêtre
+    mask = where(table, action=action) if action is not None else None
+    result = aggregate(table, ("window", "srcaddr"), mask, window)
+    return list(rows(table, result, top_per_group(result, "window", n)))
+
+
+def rejected_ports(table, n=10, window=DEFAULT_WINDOW):
+    # Ports de destination les plus rejetés de chaque fenêtre
+    result = aggregate(table, ("window", "dstport", "protocol"), where(table, action="REJECT"), window)
+    return list(rows(table, result, top_per_group(result, "window", n)))
+
+
+def top_rejected_flows(table, n=10, window=DEFAULT_WINDOW):
+    # Couples (source, port) les plus rejetés de chaque fenêtre
+    result = aggregate(table, ("window", "srcaddr", "dstport", "protocol"), where(table, action="REJECT"), window)
+    return list(rows(table, result, top_per_group(result, "window", n)))
+
+
+def subnet_rates(table, index=None, field="dstaddr", window=DEFAULT_WINDOW):
+    # Débits (flux, paquets et octets par seconde) par sous-réseau et par fenêtre. index : index de
+    # subnet_index, par défaut le découpage du VPC de vpc.py
+    index = index or index_from_params()
+    table = enrich_table(table, index, (field,))
+    subnet = f"{field[:3]}-subnet"
+    # Adresses hors du VPC écartées
+    mask = table["columns"][subnet] != code_of(table, subnet, None)
+    result = aggregate(table, ("window", subnet), mask, window)
+
+    rates = []
+    for row in rows(table, result, range(len(result["flows"]))):
+        for name in ("flows", "packets", "bytes"):
+            if name in row:
+                row[f"{name}_per_second"] = row[name] / window
+        rates.append(row)
+    return rates
+
+
+def _format_window(start):
+    return datetime.datetime.fromtimestamp(start, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agrégation des flow logs VPC par fenêtre")
+    parser.add_argument("--bucket", default=DEFAULT_BUCKET)
+    parser.add_argument("--account")
+    parser.add_argument("--region")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="Fenêtre d'agrégation en secondes")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--cache", action="store_true", help="Copie locale des objets pour les analyses répétées")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    records = scan(
+        args.bucket, args.start, args.end, args.account, args.region, columns=set(DEFAULT_COLUMNS), cache=args.cache,
+    )
+    table = load_table(records)
+    loaded = time.perf_counter()
+    talkers = top_talkers(table, args.top, window=args.window)
+    ports = rejected_ports(table, args.top, window=args.window)
+    done = time.perf_counter()
+    print(f"{table['size']} enregistrements chargés en {loaded - started:.1f} s, agrégés en {done - loaded:.2f} s")
+
+    print("\nSources les plus rejetées :")
+    for row in talkers:
+        print(f"{_format_window(row['window'])}  {row['srcaddr']:<40} {row['flows']:>8} flux {row['packets']:>10} paquets")
+
+    print("\nPorts les plus rejetés :")
+    for row in ports:
+        protocol = PROTOCOLS.get(row["protocol"], row["protocol"])
+        print(f"{_format_window(row['window'])}  {row['dstport']:>5}/{protocol:<5} {row['flows']:>8} flux")
+
+
+if __name__ == "__main__":
+    main()
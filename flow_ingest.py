@@ -0,0 +1,192 @@
+import argparse
+import datetime
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_clients import get_account_id, get_client
+from flow_logs import DEFAULT_BUCKET, list_objects, partition_prefixes, read_object
+
+
+CHECKPOINT_FILE = ".flow_logs_checkpoint.json"
+
+# Délai après la fin d'une partition au-delà duquel plus aucun objet n'y est livré : elle est alors fermée et
+# ne sera plus jamais listée
+SETTLE_DELAY = datetime.timedelta(hours=2)
+
+# Marge sous le watermark : un objet peut apparaître dans la liste avec un LastModified un peu antérieur au
+# dernier objet vu (LastModified est le début du téléversement). Seules les clés de cette marge sont conservées
+WATERMARK_MARGIN = datetime.timedelta(minutes=15)
+
+# Checkpoint sauvegardé tous les N objets traités
+SAVE_EVERY = 50
+
+_lock = threading.Lock()
+
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint, path=CHECKPOINT_FILE):
+    with _lock:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+def partitions(account, region, since, until, hive=False, per_hour=False):
+    # (préfixe, début, fin) de chaque partition (jour ou heure, UTC) de since à until inclus
+    step = datetime.timedelta(hours=1) if per_hour else datetime.timedelta(days=1)
+    start = since.replace(minute=0, second=0, microsecond=0)
+    if not per_hour:
+        start = start.replace(hour=0)
+    while start <= until:
+        hours = [start.hour] if per_hour else None
+        prefix = next(partition_prefixes(account, region, start.date(), start.date(), hive, per_hour, hours))
+        yield prefix, start, start + step
+        start += step
+
+
+def _state_key(bucket, account, region, hive, per_hour):
+    layout = ("hive" if hive else "plain") + ("-hour" if per_hour else "-day")
+    return f"{bucket}/{account}/{region}/{layout}"
+
+
+def _read_all(s3_client, bucket, key, columns):
+    return list(read_object(s3_client, bucket, key, columns))
+
+
+def _fetch(s3_client, bucket, objects, columns, max_workers):
+    # Télécharge les objets en parallèle et les restitue dans l'ordre, au plus max_workers * 2 en mémoire
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for obj in objects:
+            pending.append((obj, executor.submit(_read_all, s3_client, bucket, obj["Key"], columns)))
+            if len(pending) >= max_workers * 2:
+                obj, future = pending.popleft()
+                yield obj, future.result()
+        while pending:
+            obj, future = pending.popleft()
+            yield obj, future.result()
+
+
+def _utc(value):
+    # Une date sans fuseau est lue en UTC : les partitions et le checkpoint sont en UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc)
+
+
+def ingest(handler, bucket=DEFAULT_BUCKET, since=None, account=None, region=None, hive=False, per_hour=False,
+           columns=None, max_workers=8, path=CHECKPOINT_FILE, now=None):
+    # Passe à handler(clé, enregistrements) chaque objet de flow logs pas encore traité. Seules les partitions
+    # encore ouvertes sont listées : le coût d'une exécution suit le volume de données récentes, pas
+    # l'historique. Le checkpoint est écrit après le handler : un arrêt brutal peut faire retraiter les
+    # derniers objets (au moins une fois), jamais en sauter
+    s3_client = get_client("s3", region)
+    if account is None:
+        account = get_account_id(region)
+    region = region or s3_client.meta.region_name
+    now = _utc(now) if now else datetime.datetime.now(datetime.timezone.utc)
+    since = _utc(since) if since else None
+
+    checkpoint = load_checkpoint(path)
+    state = checkpoint.setdefault(
+        _state_key(bucket, account, region, hive, per_hour),
+        {"closed_before": None, "open": {}},
+    )
+    # On reprend à la première partition non fermée, même si plusieurs jours se sont écoulés
+    if state["closed_before"] is not None:
+        closed_before = datetime.datetime.fromisoformat(state["closed_before"])
+        start = max(since, closed_before) if since else closed_before
+    else:
+        start = since or now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    stats = {"partitions": 0, "objects": 0, "skipped": 0, "records": 0}
+    unsaved = 0
+    contiguous = True
+    for prefix, _, end in partitions(account, region, start, now, hive, per_hour):
+        stats["partitions"] += 1
+        seen = state["open"].setdefault(prefix, {"watermark": None, "keys": {}})
+        watermark = datetime.datetime.fromisoformat(seen["watermark"]) if seen["watermark"] else None
+
+        new = []
+        for obj in list_objects(s3_client, bucket, [prefix]):
+            old = watermark is not None and obj["LastModified"] < watermark - WATERMARK_MARGIN
+            if old or obj["Key"] in seen["keys"]:
+                stats["skipped"] += 1
+            else:
+                new.append(obj)
+
+        for obj, records in _fetch(s3_client, bucket, new, columns, max_workers):
+            handler(obj["Key"], records)
+            seen["keys"][obj["Key"]] = obj["LastModified"].isoformat()
+            if watermark is None or obj["LastModified"] > watermark:
+                watermark = obj["LastModified"]
+                seen["watermark"] = watermark.isoformat()
+            stats["objects"] += 1
+            stats["records"] += len(records)
+            unsaved += 1
+            if unsaved >= SAVE_EVERY:
+                save_checkpoint(checkpoint, path)
+                unsaved = 0
+
+        # Les clés sous la marge sont couvertes par le watermark
+        if watermark is not None:
+            seen["keys"] = {
+                key: modified for key, modified in seen["keys"].items()
+                if datetime.datetime.fromisoformat(modified) >= watermark - WATERMARK_MARGIN
+            }
+
+        # Partition terminée et traitée : on la ferme et les suivantes repartiront après elle
+        contiguous = contiguous and end + SETTLE_DELAY <= now
+        if contiguous:
+            del state["open"][prefix]
+            state["closed_before"] = end.isoformat()
+
+    save_checkpoint(checkpoint, path)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion incrémentale des flow logs VPC livrés dans S3")
+    parser.add_argument("--bucket", default=DEFAULT_BUCKET)
+    parser.add_argument("--account")
+    parser.add_argument("--region")
+    parser.add_argument(
+        "--since",
+        type=datetime.datetime.fromisoformat,
+        help="Début de l'ingestion au premier passage (UTC si aucun fuseau n'est donné) ; ensuite, le checkpoint prend le relais",
+    )
+    parser.add_argument("--hive", action="store_true", help="Partitions compatibles Hive (HiveCompatiblePartitions)")
+    parser.add_argument("--per-hour", action="store_true", help="Partitions par heure (PerHourPartition)")
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    args = parser.parse_args()
+
+    counts = {}
+
+    def count_actions(key, records):
+        for record in records:
+            action = record.get("action")
+            counts[action] = counts.get(action, 0) + 1
+
+    stats = ingest(
+        count_actions, args.bucket, args.since, args.account, args.region, args.hive, args.per_hour,
+        columns={"action"}, max_workers=args.max_workers, path=args.checkpoint,
+    )
+    print(f"{stats['partitions']} partitions listées, {stats['objects']} nouveaux objets "
+          f"({stats['records']} enregistrements), {stats['skipped']} déjà traités")
+    for action, count in sorted(counts.items(), key=lambda item: str(item[0])):
+        print(f"{action} : {count}")
+
+
+if __name__ == "__main__":
+    main()
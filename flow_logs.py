@@ -0,0 +1,235 @@
+import argparse
+import datetime
+import gzip
+import io
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import object_cache
+from aws_clients import get_account_id, get_client
+
+
+DEFAULT_BUCKET = "polystudentsbucket"
+
+# Champs entiers du format par défaut (v2) et des champs personnalisés courants. pkt-src-aws-service est
+# un nom de service (ex. : AMAZON, S3) et reste une chaîne
+INTEGER_FIELDS = {
+    "version", "srcport", "dstport", "protocol", "packets", "bytes", "start", "end",
+    "tcp-flags", "traffic-path",
+}
+
+OBJECT_SUFFIXES = (".log.gz", ".log.parquet")
+
+# Lignes regroupées par lot entre les threads de téléchargement et le consommateur
+BATCH_SIZE = 1000
+
+
+def partition_prefixes(account, region, start, end, hive=False, per_hour=False, hours=None):
+    # Un préfixe par jour (bornes incluses), ou par heure avec PerHourPartition. Seules les partitions
+    # demandées sont listées : les autres jours et heures ne coûtent aucun appel
+    day = start
+    while day <= end:
+        if hive:
+            prefix = (
+                f"AWSLogs/aws-account-id={account}/aws-service=vpcflowlogs/aws-region={region}/"
+                f"year={day:%Y}/month={day:%m}/day={day:%d}/"
+            )
+        else:
+            prefix = f"AWSLogs/{account}/vpcflowlogs/{region}/{day:%Y/%m/%d}/"
+
+        if per_hour:
+            for hour in sorted(hours if hours is not None else range(24)):
+                yield prefix + (f"hour={hour:02d}/" if hive else f"{hour:02d}/")
+        else:
+            yield prefix
+        day += datetime.timedelta(days=1)
+
+
+def list_objects(s3_client, bucket, prefixes):
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for prefix in prefixes:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                if obj["Key"].endswith(OBJECT_SUFFIXES):
+                    yield obj
+
+
+def parse_lines(lines, columns=None):
+    # La première ligne de chaque fichier donne les champs, ce qui couvre aussi les formats personnalisés
+    header = next(lines, None)
+    if header is None:
+        return
+    fields = header.split()
+    converters = [int if field in INTEGER_FIELDS else str for field in fields]
+    selected = [
+        (i, field, convert)
+        for i, (field, convert) in enumerate(zip(fields, converters))
+        if columns is None or field in columns
+    ]
+
+    for line in lines:
+        values = line.split()
+        if len(values) != len(fields):
+            continue
+        # "-" : champ absent pour cet enregistrement (ex. : NODATA, SKIPDATA)
+        yield {
+            field: None if values[i] == "-" else convert(values[i])
+            for i, field, convert in selected
+        }
+
+
+def read_parquet(source, columns=None):
+    # Les colonnes Parquet utilisent des "_" là où le format texte utilise des "-"
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("pyarrow est nécessaire pour lire les flow logs au format Parquet")
+
+    # source : fichier à accès aléatoire (copie locale ou contenu chargé en mémoire)
+    parquet_file = pq.ParquetFile(source)
+    names = {name: name.replace("_", "-") for name in parquet_file.schema_arrow.names}
+    wanted = None if columns is None else [name for name, field in names.items() if field in columns]
+
+    # Seules les colonnes demandées sont décodées
+    for batch in parquet_file.iter_batches(batch_size=BATCH_SIZE, columns=wanted):
+        fields = [names[name] for name in batch.schema.names]
+        for row in zip(*(column.to_pylist() for column in batch.columns)):
+            yield dict(zip(fields, row))
+
+
+def read_cached_object(s3_client, bucket, key, etag=None, columns=None):
+    # Copie locale décompressée (object_cache) : les analyses répétées ne refont ni GET ni gunzip
+    if key.endswith(".parquet"):
+        with object_cache.open_file(s3_client, bucket, key, etag) as source:
+            yield from read_parquet(source, columns)
+        return
+    with object_cache.open_object(s3_client, bucket, key, etag, gunzip=True) as data:
+        yield from parse_lines(object_cache.mapped_lines(data), columns)
+
+
+def read_object(s3_client, bucket, key, columns=None):
+    body = s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+    try:
+        if key.endswith(".parquet"):
+            # Parquet a besoin d'un accès aléatoire : le flux (une heure ou un jour de logs) est chargé en entier
+            yield from read_parquet(io.BytesIO(body.read()), columns)
+        else:
+            # Décompression au fil de l'eau : seul le tampon de lecture est en mémoire, pas le fichier entier
+            with gzip.GzipFile(fileobj=body) as raw:
+                yield from parse_lines(iter(io.TextIOWrapper(raw, encoding="utf-8")), columns)
+    finally:
+        body.close()
+
+
+def fetch_concurrently(read, items, max_workers=8):
+    # Lit plusieurs objets en parallèle avec read(item) et produit leurs enregistrements au fur et à mesure. La
+    # file est bornée : un consommateur lent bloque les téléchargements au lieu de tout accumuler en mémoire
+    batches = queue.Queue(maxsize=max_workers * 2)
+    stop = threading.Event()
+    done = object()
+    # Au plus max_workers objets soumis à la fois : un arrêt du consommateur n'en laisse aucun en attente
+    # d'être téléchargé
+    slots = threading.Semaphore(max_workers)
+
+    def fetch(item):
+        try:
+            if stop.is_set():
+                return
+            batch = []
+            for record in read(item):
+                if stop.is_set():
+                    return
+                batch.append(record)
+                if len(batch) >= BATCH_SIZE:
+                    batches.put(batch)
+                    batch = []
+            if batch:
+                batches.put(batch)
+        except Exception as e:
+            batches.put(e)
+        finally:
+            slots.release()
+
+    def produce():
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for item in items:
+                slots.acquire()
+                if stop.is_set():
+                    slots.release()
+                    break
+                executor.submit(fetch, item)
+        batches.put(done)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            batch = batches.get()
+            if batch is done:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            yield from batch
+    finally:
+        # Consommateur arrêté ou en erreur : on libère les threads bloqués sur la file
+        stop.set()
+        while producer.is_alive():
+            try:
+                batches.get_nowait()
+            except queue.Empty:
+                producer.join(0.1)
+
+
+def read_flow_logs(s3_client, bucket, keys, max_workers=8, columns=None, cache=False):
+    # keys : clés S3, ou objets de list_objects (leur ETag évite un HEAD par objet avec le cache local)
+    def read(item):
+        key, etag = (item["Key"], item.get("ETag")) if isinstance(item, dict) else (item, None)
+        if cache:
+            return read_cached_object(s3_client, bucket, key, etag, columns)
+        return read_object(s3_client, bucket, key, columns)
+
+    return fetch_concurrently(read, keys, max_workers)
+
+
+def scan(bucket, start, end, account=None, region=None, max_workers=8, hive=False, per_hour=False, hours=None,
+         columns=None, cache=False):
+    s3_client = get_client("s3", region)
+    if account is None:
+        account = get_account_id(region)
+    region = region or s3_client.meta.region_name
+
+    prefixes = partition_prefixes(account, region, start, end, hive, per_hour, hours)
+    return read_flow_logs(s3_client, bucket, list_objects(s3_client, bucket, prefixes), max_workers, columns, cache)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lecture des flow logs VPC livrés dans S3")
+    parser.add_argument("--bucket", default=DEFAULT_BUCKET)
+    parser.add_argument("--account")
+    parser.add_argument("--region")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--hive", action="store_true", help="Partitions compatibles Hive (HiveCompatiblePartitions)")
+    parser.add_argument("--per-hour", action="store_true", help="Partitions par heure (PerHourPartition)")
+    parser.add_argument("--hours", type=int, nargs="+", help="Heures à lire, avec --per-hour")
+    parser.add_argument("--cache", action="store_true", help=f"Copie locale des objets dans {object_cache.CACHE_DIR}")
+    args = parser.parse_args()
+
+    counts = {}
+    records = scan(
+        args.bucket, args.start, args.end, args.account, args.region, args.max_workers,
+        hive=args.hive, per_hour=args.per_hour, hours=args.hours, columns={"action"}, cache=args.cache,
+    )
+    for record in records:
+        action = record.get("action")
+        counts[action] = counts.get(action, 0) + 1
+
+    for action, count in sorted(counts.items(), key=lambda item: str(item[0])):
+        print(f"{action} : {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import gzip
+import ipaddress
+import os
+
+import numpy as np
+
+from network import DEFAULT_AZ_COUNT, DEFAULT_VPC_CIDR, carve_subnets, ingress_rules
+from security_group import allowed, compile_rules
+
+
+# Champs du format par défaut (v2) et d'un format personnalisé courant
+FORMATS = {
+    "v2": (
+        "version", "account-id", "interface-id", "srcaddr", "dstaddr", "srcport", "dstport", "protocol",
+        "packets", "bytes", "start", "end", "action", "log-status",
+    ),
+    "custom": (
+        "version", "account-id", "vpc-id", "subnet-id", "interface-id", "srcaddr", "dstaddr", "srcport",
+        "dstport", "protocol", "packets", "bytes", "start", "end", "action", "log-status", "tcp-flags",
+        "flow-direction",
+    ),
+}
+
+# Part de chaque type de trafic ; les scans et attaques viennent d'un petit groupe d'adresses
+DEFAULT_MIX = {
+    "normal": 0.9,
+    "horizontal_scan": 0.04,
+    "vertical_scan": 0.04,
+    "brute_force": 0.02,
+}
+
+ACCOUNT_ID = "123456789012"
+INSTANCES_PER_SUBNET = 8
+CLIENTS = 20000
+ATTACKERS = 32
+SCANNED_PORTS = (22, 23, 445, 3389, 5900, 8080)
+BRUTE_FORCED_PORTS = (22, 3389)
+
+
+def _public_addresses(rng, count):
+    # Adresses publiques aléatoires (hors 10/8, 172.16/12, 192.168/16 et plages réservées)
+    addresses = rng.integers(int(ipaddress.IPv4Address("11.0.0.0")), int(ipaddress.IPv4Address("223.0.0.0")),
+                             count * 2)
+    private = (
+        ((addresses >> 20) == (172 << 4 | 1))
+        | ((addresses >> 16) == (192 << 8 | 168))
+        | ((addresses >> 24) == 127)
+        | ((addresses >> 24) == 100)
+    )
+    return addresses[~private][:count]
+
+
+def _instances(vpc_cidr, az_count):
+    # Adresses des instances et interfaces : quelques hôtes au début de chaque sous-réseau
+    carved = carve_subnets(vpc_cidr, az_count)
+    addresses, subnets = [], []
+    for tier, cidrs in carved.items():
+        for az, cidr in enumerate(cidrs, start=1):
+            base = int(ipaddress.IPv4Network(cidr).network_address)
+            for host in range(INSTANCES_PER_SUBNET):
+                addresses.append(base + 10 + host)
+                subnets.append(f"subnet-{tier.lower()}{az:04d}")
+    return np.array(addresses, dtype=np.int64), np.array(subnets, dtype=object)
+
+
+def _services(rules):
+    # (premier port, dernier port, protocole) de chaque règle : chaque règle est visée aussi souvent
+    return np.array(
+        [(rule["FromPort"], rule["ToPort"], 17 if rule["IpProtocol"] == "udp" else 6) for rule in rules],
+        dtype=np.int64,
+    )
+
+
+def generate_columns(records, seed=0, start=1760000000, duration=3600, mix=None, vpc_cidr=DEFAULT_VPC_CIDR,
+                     az_count=DEFAULT_AZ_COUNT, interval=600, rules=ingress_rules):
+    # Génère `records` enregistrements déterministes (même graine, mêmes données) sous forme de colonnes NumPy :
+    # entiers pour les champs numériques, adresses en entiers, chaînes pour le reste
+    rng = np.random.default_rng(seed)
+    mix = mix or DEFAULT_MIX
+    unknown = sorted(set(mix) - set(DEFAULT_MIX))
+    if unknown:
+        raise ValueError(f"Types de trafic inconnus : {', '.join(unknown)} (types : {', '.join(DEFAULT_MIX)})")
+    kinds = np.array(list(mix))
+    weights = np.array(list(mix.values()), dtype=float)
+    kind = rng.choice(len(kinds), records, p=weights / weights.sum())
+
+    instances, instance_subnets = _instances(vpc_cidr, az_count)
+    clients = _public_addresses(rng, CLIENTS)
+    attackers = _public_addresses(rng, ATTACKERS)
+    services = _services(rules)
+    network = ipaddress.IPv4Network(vpc_cidr)
+
+    # Trafic normal : clients (distribution de Zipf, quelques gros clients) vers les ports autorisés
+    instance = rng.integers(0, len(instances), records)
+    dstaddr = instances[instance]
+    client = np.minimum(rng.zipf(1.3, records) - 1, CLIENTS - 1)
+    srcaddr = clients[client]
+    service = services[rng.integers(0, len(services), records)]
+    dstport = rng.integers(service[:, 0], service[:, 1] + 1)
+    protocol = service[:, 2].copy()
+    packets = np.maximum(rng.lognormal(2.0, 1.2, records).astype(np.int64), 1)
+
+    attacker = attackers[rng.integers(0, ATTACKERS, records)]
+    is_kind = {name: kind == i for i, name in enumerate(kinds)}
+
+    # Scan horizontal : un port par attaquant, sur toutes les adresses du VPC
+    mask = is_kind.get("horizontal_scan", np.zeros(records, dtype=bool))
+    srcaddr[mask] = attacker[mask]
+    dstaddr[mask] = int(network.network_address) + rng.integers(4, network.num_addresses - 1, mask.sum())
+    dstport[mask] = np.array(SCANNED_PORTS)[attacker[mask] % len(SCANNED_PORTS)]
+    protocol[mask] = 6
+    packets[mask] = 1
+
+    # Scan vertical : tous les ports d'une instance
+    mask = is_kind.get("vertical_scan", np.zeros(records, dtype=bool))
+    srcaddr[mask] = attacker[mask]
+    dstaddr[mask] = instances[attacker[mask] % len(instances)]
+    dstport[mask] = rng.integers(1, 65536, mask.sum())
+    protocol[mask] = 6
+    packets[mask] = 1
+
+    # Force brute : connexions répétées sur SSH / RDP
+    mask = is_kind.get("brute_force", np.zeros(records, dtype=bool))
+    srcaddr[mask] = attacker[mask]
+    dstaddr[mask] = instances[attacker[mask] % len(instances)]
+    dstport[mask] = np.array(BRUTE_FORCED_PORTS)[attacker[mask] % len(BRUTE_FORCED_PORTS)]
+    protocol[mask] = 6
+    packets[mask] = rng.integers(8, 30, mask.sum())
+
+    # Ce que le groupe de sécurité refuse est rejeté ; une petite part du reste est rejetée par l'ACL réseau
+    accepted = allowed(compile_rules(rules), protocol, dstport, srcaddr) & (rng.random(records) > 0.01)
+
+    first = start + np.sort(rng.integers(0, duration, records))
+    return {
+        "version": np.full(records, 2, dtype=np.int64),
+        "account-id": np.full(records, ACCOUNT_ID, dtype=object),
+        "vpc-id": np.full(records, "vpc-0123456789abcdef0", dtype=object),
+        "subnet-id": instance_subnets[instance],
+        "interface-id": np.array([f"eni-{i:017x}" for i in range(len(instances))], dtype=object)[instance],
+        "srcaddr": srcaddr,
+        "dstaddr": dstaddr,
+        "srcport": rng.integers(32768, 61000, records),
+        "dstport": dstport,
+        "protocol": protocol,
+        "packets": packets,
+        "bytes": packets * rng.integers(40, 1500, records),
+        "start": first,
+        "end": first + rng.integers(0, interval, records),
+        "action": np.where(accepted, "ACCEPT", "REJECT").astype(object),
+        "log-status": np.full(records, "OK", dtype=object),
+        "tcp-flags": np.where(accepted, 19, 2),
+        "flow-direction": np.full(records, "ingress", dtype=object),
+    }
+
+
+def _text_column(values, field):
+    if field in ("srcaddr", "dstaddr"):
+        octets = [((values >> shift) & 255).tolist() for shift in (24, 16, 8, 0)]
+        return [f"{a}.{b}.{c}.{d}" for a, b, c, d in zip(*octets)]
+    return list(map(str, values.tolist()))
+
+
+def to_text(columns, fields):
+    # Contenu d'un fichier de flow logs texte : ligne d'en-tête puis un enregistrement par ligne
+    text_columns = [_text_column(columns[field], field) for field in fields]
+    return " ".join(fields) + "\n" + "".join(" ".join(values) + "\n" for values in zip(*text_columns))
+
+
+def to_arrow(columns, fields):
+    import pyarrow as pa
+
+    arrays = {}
+    for field in fields:
+        values = columns[field]
+        if field in ("srcaddr", "dstaddr"):
+            values = _text_column(values, field)
+        arrays[field.replace("-", "_")] = pa.array(values.tolist() if hasattr(values, "tolist") else values)
+    return pa.table(arrays)
+
+
+def write_file(path, columns, fields, file_format="plain-text"):
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+
+        pq.write_table(to_arrow(columns, fields), path)
+    else:
+        # Niveau de compression par défaut de zlib, plus proche des livraisons réelles que le niveau 9 de gzip
+        with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write(to_text(columns, fields))
+    return path
+
+
+def generate_files(directory, files=1, records_per_file=100_000, flow_format="v2", file_format="plain-text",
+                   seed=0, mix=None):
+    # Fichiers nommés comme les livraisons VPC Flow Logs ; chaque fichier a sa propre graine dérivée de `seed`
+    os.makedirs(directory, exist_ok=True)
+    extension = "log.parquet" if file_format == "parquet" else "log.gz"
+    paths = []
+    for i in range(files):
+        columns = generate_columns(records_per_file, seed=seed * 1000 + i, start=1760000000 + i * 600, mix=mix)
+        name = f"{ACCOUNT_ID}_vpcflowlogs_ca-central-1_fl-synthetic_{i:06d}.{extension}"
+        paths.append(write_file(os.path.join(directory, name), columns, FORMATS[flow_format], file_format))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génération de flow logs VPC synthétiques")
+    parser.add_argument("--output", default="synthetic_flow_logs")
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--records", type=int, default=100_000, help="Enregistrements par fichier")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="v2")
+    parser.add_argument("--file-format", choices=("plain-text", "parquet"), default="plain-text")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--mix", nargs="+", metavar="TYPE=PART",
+        help=f"Part de chaque type de trafic ({', '.join(DEFAULT_MIX)})",
+    )
+    args = parser.parse_args()
+
+    mix = None
+    if args.mix:
+        mix = {name: float(share) for name, share in (item.split("=", 1) for item in args.mix)}
+
+    paths = generate_files(args.output, args.files, args.records, args.format, args.file_format, args.seed, mix)
+    print(f"{len(paths)} fichiers générés dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+import json
+import re
+from contextlib import contextmanager
+
+import troposphere
+from troposphere import AWSHelperFn, Template, Parameter, Output
+from troposphere.cloudformation import Stack
+
+
+# Limites CloudFormation par template
+MAX_RESOURCES = 500
+MAX_PARAMETERS = 200
+MAX_OUTPUTS = 200
+MAX_TEMPLATE_SIZE = 1024 * 1024
+
+# Ordre des stacks imbriquées : chaque groupe ne référence que les groupes qui le précèdent
+GROUPS = ("Network", "Logging", "Compute", "Monitoring", "Shared")
+
+GROUP_BY_TYPE = {
+    "AWS::EC2::Instance": "Compute",
+    "AWS::EC2::FlowLog": "Logging",
+    "AWS::S3::BucketPolicy": "Logging",
+    "AWS::IAM::Role": "Logging",
+}
+GROUP_BY_PREFIX = (
+    ("AWS::EC2::", "Network"),
+    ("AWS::Logs::", "Logging"),
+    ("AWS::CloudTrail::", "Logging"),
+    ("AWS::CloudWatch::", "Monitoring"),
+    ("AWS::SNS::", "Monitoring"),
+)
+
+SUB_VARIABLE = re.compile(r"\$\{([^!}][^}]*)\}")
+
+
+class _Raw(AWSHelperFn):
+    # Expression CloudFormation déjà sous forme de dict, insérée telle quelle dans un objet troposphere
+    def __init__(self, data):
+        self.data = data
+
+
+@contextmanager
+def unbounded_templates():
+    # troposphere refuse de construire un template au-delà des limites CloudFormation ; on les lève le temps de
+    # générer le template complet, qui sera ensuite découpé
+    limits = troposphere.MAX_RESOURCES, troposphere.MAX_OUTPUTS, troposphere.MAX_PARAMETERS
+    troposphere.MAX_RESOURCES = troposphere.MAX_OUTPUTS = troposphere.MAX_PARAMETERS = float("inf")
+    try:
+        yield
+    finally:
+        troposphere.MAX_RESOURCES, troposphere.MAX_OUTPUTS, troposphere.MAX_PARAMETERS = limits
+
+
+def _render(body):
+    return json.dumps(body, sort_keys=True, separators=(",", ":"))
+
+
+def exceeds_limits(body):
+    # body : template sous forme de dict
+    return (
+        len(body.get("Resources", {})) > MAX_RESOURCES
+        or len(body.get("Parameters", {})) > MAX_PARAMETERS
+        or len(body.get("Outputs", {})) > MAX_OUTPUTS
+        or len(_render(body).encode("utf-8")) > MAX_TEMPLATE_SIZE
+    )
+
+
+def resource_group(resource_type):
+    if resource_type in GROUP_BY_TYPE:
+        return GROUP_BY_TYPE[resource_type]
+    for prefix, group in GROUP_BY_PREFIX:
+        if resource_type.startswith(prefix):
+            return group
+    return "Shared"
+
+
+def _import_name(name, attribute=None):
+    # Nom du paramètre (côté consommateur) et de l'output (côté producteur) pour une référence inter-stacks
+    if attribute is None:
+        return name
+    return name + re.sub(r"[^A-Za-z0-9]", "", attribute)
+
+
+def _depends_on(resource):
+    depends_on = resource.get("DependsOn", [])
+    return [depends_on] if isinstance(depends_on, str) else list(depends_on)
+
+
+def _dependencies(node, found):
+    # Ressources et paramètres référencés par Ref, Fn::GetAtt et Fn::Sub
+    if isinstance(node, dict):
+        if len(node) == 1:
+            key, value = next(iter(node.items()))
+            if key == "Ref" and isinstance(value, str):
+                found.add(value)
+                return
+            if key == "Fn::GetAtt":
+                found.add(value.split(".", 1)[0] if isinstance(value, str) else value[0])
+                return
+            if key == "Fn::Sub":
+                text, variables = (value, {}) if isinstance(value, str) else value
+                for token in SUB_VARIABLE.findall(text):
+                    name = token.split(".", 1)[0]
+                    if name not in variables:
+                        found.add(name)
+                _dependencies(variables, found)
+                return
+        for value in node.values():
+            _dependencies(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            _dependencies(value, found)
+
+
+def _rewrite(node, is_local, on_import):
+    # Remplace les références vers l'extérieur du template courant ; on_import(name, attribute) retourne
+    # l'expression de remplacement pour Ref/GetAtt et le nom de variable pour Fn::Sub
+    if isinstance(node, list):
+        return [_rewrite(value, is_local, on_import) for value in node]
+    if not isinstance(node, dict):
+        return node
+
+    if len(node) == 1:
+        key, value = next(iter(node.items()))
+        if key == "Ref" and isinstance(value, str):
+            if value.startswith("AWS::") or is_local(value):
+                return node
+            return on_import(value, None)["expression"]
+        if key == "Fn::GetAtt":
+            name, attribute = value.split(".", 1) if isinstance(value, str) else value
+            if is_local(name):
+                return node
+            return on_import(name, attribute)["expression"]
+        if key == "Fn::Sub":
+            text, variables = (value, {}) if isinstance(value, str) else value
+
+            def replace(match):
+                token = match.group(1)
+                name, _, attribute = token.partition(".")
+                if token.startswith("AWS::") or name in variables or is_local(name):
+                    return match.group(0)
+                return "${" + on_import(name, attribute or None)["variable"] + "}"
+
+            text = SUB_VARIABLE.sub(replace, text)
+            variables = _rewrite(variables, is_local, on_import)
+            return {"Fn::Sub": [text, variables] if variables else text}
+
+    return {key: _rewrite(value, is_local, on_import) for key, value in node.items()}
+
+
+def _topological_order(resources):
+    order = []
+    state = {}
+
+    def visit(name):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Dépendance circulaire sur la ressource {name}")
+        state[name] = "visiting"
+        found = set(_depends_on(resources[name]))
+        _dependencies(resources[name].get("Properties", {}), found)
+        for dep in sorted(found):
+            if dep in resources:
+                visit(dep)
+        state[name] = "done"
+        order.append(name)
+
+    for name in resources:
+        visit(name)
+    return order
+
+
+def _stack_names(chunks):
+    names = []
+    for group, _ in chunks:
+        total = sum(1 for g, _ in chunks if g == group)
+        index = sum(1 for n in names if n.startswith(group + "Stack")) + 1
+        names.append(f"{group}Stack" if total == 1 else f"{group}Stack{index}")
+    return names
+
+
+def _wire(body, chunks):
+    parameters = body.get("Parameters", {})
+    resources = body["Resources"]
+    names = _stack_names(chunks)
+    owner = {resource: names[i] for i, (_, members) in enumerate(chunks) for resource in members}
+
+    children = {}
+    # Paramètres à passer par le parent et stacks dont chaque stack imbriquée dépend
+    links = {}
+    for name, (_, members) in zip(names, chunks):
+        children[name] = {
+            "AWSTemplateFormatVersion": "2010-09-09",
+            "Parameters": {},
+            "Resources": {},
+            "Outputs": {},
+        }
+        links[name] = {"inputs": {}, "depends_on": set()}
+        for key in ("Mappings", "Conditions"):
+            if key in body:
+                children[name][key] = body[key]
+
+    def export(producer, name, attribute):
+        output = _import_name(name, attribute)
+        value = {"Ref": name} if attribute is None else {"Fn::GetAtt": [name, attribute]}
+        children[producer]["Outputs"][output] = {"Value": value}
+        return output
+
+    for stack_name, (_, members) in zip(names, chunks):
+        child = children[stack_name]
+        link = links[stack_name]
+        local = set(members)
+
+        def on_import(name, attribute, child=child, link=link):
+            variable = _import_name(name, attribute)
+            if name in parameters:
+                child["Parameters"][name] = parameters[name]
+                link["inputs"][name] = {"Ref": name}
+            else:
+                producer = owner[name]
+                output = export(producer, name, attribute)
+                child["Parameters"][variable] = {"Type": "String"}
+                link["inputs"][variable] = {"Fn::GetAtt": [producer, f"Outputs.{output}"]}
+                link["depends_on"].add(producer)
+            return {"expression": {"Ref": variable}, "variable": variable}
+
+        for resource_name in members:
+            resource = dict(resources[resource_name])
+            depends_on = _depends_on(resource)
+            if depends_on:
+                # Un DependsOn vers une autre stack devient une dépendance entre stacks imbriquées
+                link["depends_on"].update(owner[d] for d in depends_on if d not in local)
+                local_depends_on = [d for d in depends_on if d in local]
+                if local_depends_on:
+                    resource["DependsOn"] = local_depends_on
+                else:
+                    del resource["DependsOn"]
+            child["Resources"][resource_name] = _rewrite(resource, local.__contains__, on_import)
+
+    # Outputs du template d'origine, relayés par le parent depuis les stacks imbriquées
+    def parent_import(name, attribute):
+        producer = owner[name]
+        output = export(producer, name, attribute)
+        return {
+            "expression": {"Fn::GetAtt": [producer, f"Outputs.{output}"]},
+            "variable": f"{producer}.Outputs.{output}",
+        }
+
+    outputs = {
+        name: _rewrite(output, parameters.__contains__, parent_import)
+        for name, output in body.get("Outputs", {}).items()
+    }
+
+    return names, children, links, outputs
+
+
+def _partition(body, max_resources):
+    resources = body["Resources"]
+    order = _topological_order(resources)
+
+    chunks = []
+    for group in GROUPS:
+        members = [name for name in order if resource_group(resources[name]["Type"]) == group]
+        for start in range(0, len(members), max_resources):
+            chunks.append((group, members[start:start + max_resources]))
+
+    # On coupe en deux toute stack imbriquée qui dépasse encore une limite (paramètres, outputs, taille),
+    # jusqu'à ce que toutes passent ; l'ordre topologique interdit les cycles au sein d'un groupe
+    while True:
+        names, children, links, outputs = _wire(body, chunks)
+        oversized = [i for i, name in enumerate(names) if exceeds_limits(children[name])]
+        if not oversized:
+            return names, children, links, outputs
+        for i in reversed(oversized):
+            group, members = chunks[i]
+            if len(members) == 1:
+                raise ValueError(f"La ressource {members[0]} ne tient dans aucune stack imbriquée")
+            half = len(members) // 2
+            chunks[i:i + 1] = [(group, members[:half]), (group, members[half:])]
+
+
+def _check_acyclic(names, links):
+    state = {}
+
+    def visit(name):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Dépendance circulaire entre stacks imbriquées autour de {name}")
+        state[name] = "visiting"
+        for dep in links[name]["depends_on"]:
+            visit(dep)
+        state[name] = "done"
+
+    for name in names:
+        visit(name)
+
+
+def split_template(template, template_url, max_resources=MAX_RESOURCES):
+    # Découpe template en stacks imbriquées (réseau, logs, calcul, surveillance) ; template_url(nom, corps)
+    # retourne l'URL S3 où le corps de la stack imbriquée sera téléversé. Retourne le template parent et
+    # les corps des stacks imbriquées à téléverser, par nom
+    body = template.to_dict()
+    names, children, links, outputs = _partition(body, max_resources)
+    _check_acyclic(names, links)
+
+    parent = Template()
+    if "Description" in body:
+        parent.set_description(body["Description"])
+    for name, definition in body.get("Parameters", {}).items():
+        parent.add_parameter(Parameter(name, **definition))
+
+    bodies = {}
+    for name in names:
+        child = children[name]
+        inputs = links[name]["inputs"]
+        depends_on = sorted(links[name]["depends_on"])
+        for key in ("Parameters", "Outputs"):
+            if not child[key]:
+                del child[key]
+        bodies[name] = _render(child)
+
+        # Sans dépendance entre elles, CloudFormation crée les stacks imbriquées en parallèle
+        stack = Stack(
+            name,
+            TemplateURL=template_url(name, bodies[name]),
+            Parameters={key: _Raw(value) for key, value in sorted(inputs.items())},
+        )
+        if depends_on:
+            stack.DependsOn = depends_on
+        parent.add_resource(stack)
+
+    # Au-delà de 200 outputs, le parent n'en relaie qu'une partie ; les autres restent lisibles dans les
+    # outputs des stacks imbriquées
+    kept = list(outputs.items())[:MAX_OUTPUTS]
+    if len(kept) < len(outputs):
+        print(f"{len(outputs) - len(kept)} outputs ne sont disponibles que dans les stacks imbriquées")
+    for name, output in kept:
+        parent.add_output(Output(
+            name,
+            Value=_Raw(output["Value"]),
+            **({"Description": output["Description"]} if "Description" in output else {}),
+        ))
+
+    return parent, bodies
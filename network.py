@@ -0,0 +1,322 @@
+import ipaddress
+import math
+from functools import lru_cache
+
+from troposphere import Template, Ref, Tags, Join, Sub, Select, GetAZs, GetAtt, Cidr, Parameter, Output
+from troposphere.ec2 import (
+    VPC,
+    Subnet,
+    RouteTable,
+    InternetGateway,
+    VPCGatewayAttachment,
+    NatGateway,
+    EIP,
+    Route,
+    SubnetRouteTableAssociation,
+    SecurityGroup,
+    SecurityGroupRule
+)
+
+# Règles d'entrée du groupe de sécurité polystudent-sg
+ingress_rules = [
+    {"IpProtocol": "tcp", "FromPort": 22, "ToPort": 22, "CidrIp": "0.0.0.0/0"},
+    {"IpProtocol": "tcp", "FromPort": 80, "ToPort": 80, "CidrIp": "0.0.0.0/0"},
+    {"IpProtocol": "tcp", "FromPort": 443, "ToPort": 443, "CidrIp": "0.0.0.0/0"},
+    {"IpProtocol": "tcp", "FromPort": 53, "ToPort": 53, "CidrIp": "0.0.0.0/0"},
+    {"IpProtocol": "udp", "FromPort": 53, "ToPort": 53, "CidrIp": "0.0.0.0/0"},
+    {"IpProtocol": "tcp", "FromPort": 1433, "ToPort": 1433, "CidrIp": "0.0.0.0/0"},
+    {"IpProtocol": "tcp", "FromPort": 5432, "ToPort": 5432, "CidrIp": "0.0.0.0/0"},
+    {"IpProtocol": "tcp", "FromPort": 3306, "ToPort": 3306, "CidrIp": "0.0.0.0/0"},
+    {"IpProtocol": "tcp", "FromPort": 3389, "ToPort": 3389, "CidrIp": "0.0.0.0/0"},
+    {"IpProtocol": "tcp", "FromPort": 1514, "ToPort": 1514, "CidrIp": "0.0.0.0/0"},
+    {"IpProtocol": "tcp", "FromPort": 9200, "ToPort": 9300, "CidrIp": "0.0.0.0/0"}
+]
+
+DEFAULT_AZ_COUNT = 2
+DEFAULT_VPC_CIDR = "10.0.0.0/16"
+
+# Paramètres qui influencent le fragment réseau ; les autres sont ignorés pour la mémoïsation
+NETWORK_PARAMETERS = (
+    "AZCount",
+    "EnvironmentName",
+    "VpcCIDR",
+)
+
+
+def subnet_layout(vpc_cidr, az_count):
+    # Moitié basse du VPC pour les sous-réseaux publics, moitié haute pour les privés. Chaque AZ reçoit un
+    # bloc de la moitié (un /20 pour un /16 jusqu'à 8 AZ) et son sous-réseau en occupe le début, ce qui
+    # redonne 10.0.0.0/24, 10.0.16.0/24, 10.0.128.0/24 et 10.0.144.0/24 pour deux AZ
+    network = ipaddress.ip_network(vpc_cidr)
+    block_prefix = network.prefixlen + 1 + max(3, math.ceil(math.log2(az_count)))
+    subnet_prefix = max(block_prefix, network.prefixlen + 8)
+    count = 2 ** (subnet_prefix - network.prefixlen)
+    # Fn::Cidr ne génère pas plus de 256 blocs
+    if count > 256 or subnet_prefix > 28:
+        raise ValueError(f"{vpc_cidr} ne peut pas être découpé pour {az_count} AZ")
+
+    stride = 2 ** (subnet_prefix - block_prefix)
+    return {
+        "count": count,
+        "prefix": subnet_prefix,
+        "host_bits": network.max_prefixlen - subnet_prefix,
+        "indexes": {
+            "Public": [az * stride for az in range(az_count)],
+            "Private": [count // 2 + az * stride for az in range(az_count)],
+        },
+    }
+
+
+def carve_subnets(vpc_cidr, az_count):
+    # Même découpage que Fn::Cidr dans le template, calculé localement
+    layout = subnet_layout(vpc_cidr, az_count)
+    subnets = list(ipaddress.ip_network(vpc_cidr).subnets(new_prefix=layout["prefix"]))
+    return {tier: [str(subnets[i]) for i in indexes] for tier, indexes in layout["indexes"].items()}
+
+
+@lru_cache(maxsize=None)
+def _build_network(key):
+    params = dict(key)
+    az_count = int(params.get("AZCount", DEFAULT_AZ_COUNT))
+    if az_count < 1:
+        raise ValueError("AZCount doit être au moins 1")
+    layout = subnet_layout(params.get("VpcCIDR", DEFAULT_VPC_CIDR), az_count)
+
+    # Template de travail : il ne sert qu'à regrouper les objets du fragment
+    template = Template()
+
+    ############ Paramètres ############
+
+    environment_name = template.add_parameter(
+        Parameter(
+            "EnvironmentName",
+            Type="String",
+            Description="Environment is prefixed to resource names",
+            Default=params.get("EnvironmentName", "PolyEnvironment")
+        )
+    )
+
+    vpc_cidr = template.add_parameter(
+        Parameter(
+            "VpcCIDR",
+            Description="VPC polystudent-vpc",
+            Type="String",
+            Default=params.get("VpcCIDR", DEFAULT_VPC_CIDR)
+        )
+    )
+
+    ############ Ressources ############
+
+    # VPC
+    vpc = template.add_resource(
+        VPC(
+            "VPC",
+            CidrBlock=Ref(vpc_cidr),
+            EnableDnsSupport=True,
+            EnableDnsHostnames=True,
+            Tags=Tags(Name=Ref(environment_name)),
+        )
+    )
+
+    # Internet Gateway
+    internet_gateway = template.add_resource(
+        InternetGateway(
+            "InternetGateway",
+            Tags=Tags(Name=Ref(environment_name))
+        )
+    )
+
+    gateway_attachment = template.add_resource(
+        VPCGatewayAttachment(
+            "InternetGatewayAttachment",
+            VpcId=Ref(vpc),
+            InternetGatewayId=Ref(internet_gateway),
+        )
+    )
+
+    # Public Route Table
+
+    public_route_table = template.add_resource(
+        RouteTable(
+            "PublicRouteTable",
+            VpcId=Ref(vpc),
+            Tags=Tags(Name=Sub("${EnvironmentName} Public Routes"))
+        )
+    )
+
+    default_public_route = template.add_resource(
+        Route(
+            "DefaultPublicRoute",
+            DependsOn="InternetGatewayAttachment",
+            RouteTableId=Ref(public_route_table),
+            DestinationCidrBlock="0.0.0.0/0",
+            GatewayId=Ref(internet_gateway)
+        )
+    )
+
+    # Les CIDR des sous-réseaux sont découpés dans VpcCIDR au déploiement
+    subnet_cidrs = Cidr(Ref(vpc_cidr), layout["count"], layout["host_bits"])
+
+    # Un sous-réseau public avec sa NAT gateway et un sous-réseau privé avec sa table de routage par AZ
+    public_subnets = []
+    private_subnets = []
+
+    for az in range(1, az_count + 1):
+        public_subnet = template.add_resource(
+            Subnet(
+                f"PublicSubnet{az}",
+                VpcId=Ref(vpc),
+                AvailabilityZone=Select(az - 1, GetAZs("")),
+                CidrBlock=Select(layout["indexes"]["Public"][az - 1], subnet_cidrs),
+                MapPublicIpOnLaunch=True,
+                Tags=Tags(Name=Sub(f"${{EnvironmentName}} Public Subnet (AZ{az})")),
+            )
+        )
+
+        private_subnet = template.add_resource(
+            Subnet(
+                f"PrivateSubnet{az}",
+                VpcId=Ref(vpc),
+                AvailabilityZone=Select(az - 1, GetAZs("")),
+                CidrBlock=Select(layout["indexes"]["Private"][az - 1], subnet_cidrs),
+                MapPublicIpOnLaunch=False,
+                Tags=Tags(Name=Sub(f"${{EnvironmentName}} Private Subnet (AZ{az})")),
+            )
+        )
+
+        # Nat Gateway
+
+        nat_gateway_eip = template.add_resource(
+            EIP(
+                f"NatGateway{az}EIP",
+                DependsOn="InternetGatewayAttachment",
+                Domain="vpc"
+            )
+        )
+
+        nat_gateway = template.add_resource(
+            NatGateway(
+                f"NatGateway{az}",
+                AllocationId=GetAtt(nat_gateway_eip, "AllocationId"),
+                SubnetId=Ref(public_subnet)
+            )
+        )
+
+        # Routes
+
+        template.add_resource(
+            SubnetRouteTableAssociation(
+                f"PublicSubnet{az}RouteTableAssociation",
+                RouteTableId=Ref(public_route_table),
+                SubnetId=Ref(public_subnet)
+            )
+        )
+
+        private_route_table = template.add_resource(
+            RouteTable(
+                f"PrivateRouteTable{az}",
+                VpcId=Ref(vpc),
+                Tags=Tags(Name=Sub(f"${{EnvironmentName}} Private Routes (AZ{az})"))
+            )
+        )
+
+        template.add_resource(
+            Route(
+                f"DefaultPrivateRoute{az}",
+                RouteTableId=Ref(private_route_table),
+                DestinationCidrBlock="0.0.0.0/0",
+                NatGatewayId=Ref(nat_gateway)
+            )
+        )
+
+        template.add_resource(
+            SubnetRouteTableAssociation(
+                f"PrivateSubnet{az}RouteTableAssociation",
+                RouteTableId=Ref(private_route_table),
+                SubnetId=Ref(private_subnet)
+            )
+        )
+
+        public_subnets.append(public_subnet)
+        private_subnets.append(private_subnet)
+
+    # Security Group
+
+    security_group = template.add_resource(
+        SecurityGroup(
+            "IngressSecurityGroup",
+            GroupDescription="Security group allows SSH, HTTP, HTTPS, MSSQL, DNS, PostgreSQL, MySQL, RDP, OSSEC and ElasticSearch",
+            GroupName="polystudent-sg",
+            VpcId=Ref(vpc),
+            SecurityGroupIngress=[SecurityGroupRule(**rule) for rule in ingress_rules]
+
+        )
+    )
+
+    ############ OUTPUT ############
+
+    # VPC Output
+    template.add_output(
+        Output(
+            "VPC",
+            Description="A reference to the created VPC",
+            Value=Ref(vpc)
+        )
+    )
+
+    # Subnets Output
+    template.add_output(
+        Output(
+            "PublicSubnets",
+            Description="A list of the public subnets",
+            Value=Join(",", [Ref(subnet) for subnet in public_subnets])
+        )
+    )
+
+    template.add_output(
+        Output(
+            "PrivateSubnets",
+            Description="A list of the private subnets",
+            Value=Join(",", [Ref(subnet) for subnet in private_subnets])
+        )
+    )
+
+    for az in range(1, az_count + 1):
+        for tier, subnet in (("public", public_subnets[az - 1]), ("private", private_subnets[az - 1])):
+            template.add_output(
+                Output(
+                    subnet.title,
+                    Description=f"A reference to the {tier} subnet in Availability Zone {az}",
+                    Value=Ref(subnet)
+                )
+            )
+
+    refs = {
+        "az_count": az_count,
+        "environment_name": environment_name,
+        "vpc": vpc,
+        "public_subnets": tuple(public_subnets),
+        "private_subnets": tuple(private_subnets),
+        "security_group": security_group,
+    }
+    return template, refs
+
+
+def network_fragment(params=None):
+    # Les objets retournés sont partagés entre tous les appels avec les mêmes paramètres : ne pas les modifier
+    params = params or {}
+    key = tuple(sorted((name, params[name]) for name in NETWORK_PARAMETERS if name in params))
+    return _build_network(key)
+
+
+def add_network(template, params=None):
+    fragment, refs = network_fragment(params)
+
+    for parameter in fragment.parameters.values():
+        template.add_parameter(parameter)
+    for resource in fragment.resources.values():
+        template.add_resource(resource)
+    for output in fragment.outputs.values():
+        template.add_output(output)
+
+    return refs
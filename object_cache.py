@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+CACHE_DIR = ".object_cache"
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+_lock = threading.Lock()
+# Par répertoire de cache : chemin -> taille, du moins au plus récemment utilisé
+_indexes = {}
+
+
+def _index(directory):
+    # Reconstruit l'ordre LRU à partir des dates de modification, mises à jour à chaque lecture
+    if directory not in _indexes:
+        entries = []
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, path, stat.st_size))
+        _indexes[directory] = OrderedDict((path, size) for _, path, size in sorted(entries))
+    return _indexes[directory]
+
+
+def cache_path(bucket, key, etag, directory=CACHE_DIR):
+    # L'ETag fait partie de la clé : un objet réécrit dans S3 n'est jamais servi depuis une ancienne copie
+    digest = hashlib.sha256(f"{bucket}/{key}/{etag.strip(chr(34))}".encode("utf-8")).hexdigest()
+    return os.path.join(directory, digest[:2], digest)
+
+
+def _evict(index, max_bytes):
+    # Le fichier le plus récent (celui qu'on vient d'ajouter) est toujours gardé, même s'il dépasse la limite
+    total = sum(index.values())
+    while total > max_bytes and len(index) > 1:
+        path, size = index.popitem(last=False)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def open_file(s3_client, bucket, key, etag=None, gunzip=False, directory=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    # Copie locale de l'objet ouverte en lecture, téléchargée (et décompressée si gunzip) au premier accès
+    # seulement. Jamais de chemin : l'éviction se fait sous le verrou, et ouvrir le fichier sous ce même verrou
+    # garantit qu'il existe encore. Un descripteur ouvert reste lisible après la suppression du fichier
+    if etag is None:
+        etag = s3_client.head_object(Bucket=bucket, Key=key)["ETag"]
+    path = cache_path(bucket, key, etag, directory)
+
+    with _lock:
+        index = _index(directory)
+        if path in index and os.path.exists(path):
+            index.move_to_end(path)
+            os.utime(path)
+            return open(path, "rb")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    body = s3_client.get_object(Bucket=bucket, Key=key, IfMatch=etag)["Body"]
+    # Écriture dans un fichier temporaire puis renommage : un lecteur ne voit jamais de fichier partiel
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            if gunzip:
+                with gzip.GzipFile(fileobj=body) as raw:
+                    shutil.copyfileobj(raw, out, 1024 * 1024)
+            else:
+                shutil.copyfileobj(body, out, 1024 * 1024)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    finally:
+        body.close()
+
+    with _lock:
+        # Renommage sous le verrou : une éviction lancée par un autre thread ne peut pas supprimer le fichier
+        # entre son renommage et son ajout à l'index
+        os.replace(tmp_path, path)
+        index = _index(directory)
+        index[path] = os.path.getsize(path)
+        index.move_to_end(path)
+        _evict(index, max_bytes)
+        # Le fichier qu'on vient d'ajouter est le plus récent : l'éviction l'a gardé
+        return open(path, "rb")
+
+
+@contextmanager
+def open_object(s3_client, bucket, key, etag=None, gunzip=False, directory=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    # Contenu de l'objet projeté en mémoire (mmap) : les lectures répétées n'ont ni GET S3 ni décompression,
+    # et seules les pages lues sont chargées. Un fichier évincé pendant la lecture reste lisible
+    with open_file(s3_client, bucket, key, etag, gunzip, directory, max_bytes) as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def mapped_lines(data):
+    # Lignes décodées d'un contenu projeté en mémoire, sans le copier en entier
+    start = 0
+    size = len(data)
+    while start < size:
+        end = data.find(b"\n", start)
+        end = size if end == -1 else end + 1
+        yield data[start:end].decode("utf-8")
+        start = end
+
+
+def clear(directory=CACHE_DIR):
+    with _lock:
+        _indexes.pop(directory, None)
+        shutil.rmtree(directory, ignore_errors=True)
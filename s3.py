@@ -1,8 +1,17 @@
-import boto3
 from troposphere import Template, Output, Ref
 from troposphere.s3 import Bucket, PublicAccessBlockConfiguration, BucketEncryption, ServerSideEncryptionRule, ServerSideEncryptionByDefault, VersioningConfiguration
 
-def create_s3_template():
+from aws_clients import get_client
+from bucket_profile import apply_bucket_profile
+from deploy_cache import deploy_if_changed
+
+
+# Stack déployée par ce script ; deploy_all.STACKS reprend ce nom
+STACK_NAME = "s3-secure-bucket-stack"
+
+
+def create_s3_template(params=None):
+    params = params or {}
     template = Template()
     template.set_description("S3 bucket")
 
@@ -40,6 +49,7 @@ def create_s3_template():
         BucketEncryption=encryption,
         VersioningConfiguration=versioning
     ))
+    apply_bucket_profile(bucket, params)
 
     # Ajout de l'output
     template.add_output(Output(
@@ -51,27 +61,16 @@ def create_s3_template():
     return template
 
 
-def deploy_template():
-    import boto3
-
-    access_key = 'your_access_key'
-    secret_key = 'your_secret_key'
-    region = 'your_region'
-
-    cf_client = boto3.client('cloudformation', aws_access_key_id=access_key, aws_secret_access_key=secret_key, region_name=region)
+def deploy_template(params=None):
+    cf_client = get_client('cloudformation')
     
-    template = create_s3_template()
+    template = create_s3_template(params)
     
     # Initialiser le client CloudFormation
     
     # Déployer le stack
-    stack_name = "s3-secure-bucket-stack"
-    cf_client.create_stack(
-        StackName=stack_name,
-        TemplateBody=template.to_json(),
-    )
-
-    print(f"Déploiement du stack {stack_name} en cours...")
+    stack_name = STACK_NAME
+    deploy_if_changed(cf_client, stack_name, template)
 
 if __name__ == "__main__":
     deploy_template()
@@ -1,5 +1,5 @@
-import boto3
-from troposphere import Template, Output, Ref, GetAtt
+from troposphere import Template, Output, Ref, GetAtt, Parameter
+from troposphere.cloudwatch import Alarm, MetricDimension
 from troposphere.s3 import (
     Bucket, 
     PublicAccessBlockConfiguration, 
@@ -9,11 +9,161 @@ from troposphere.s3 import (
     VersioningConfiguration, 
     ReplicationConfiguration, 
     ReplicationConfigurationRules,
-    ReplicationConfigurationRulesDestination
+    ReplicationConfigurationRulesDestination,
+    ReplicationRuleFilter,
+    ReplicationRuleAndOperator,
+    TagFilter,
+    DeleteMarkerReplication,
+    SourceSelectionCriteria,
+    SseKmsEncryptedObjects,
+    EncryptionConfiguration,
+    Metrics,
+    ReplicationTime,
+    ReplicationTimeValue,
 )
 from troposphere.iam import Role, Policy
 
-def create_s3_template():
+from aws_clients import get_client
+from bucket_profile import apply_bucket_profile
+from deploy_cache import deploy_if_changed
+
+
+# Stack déployée par ce script ; deploy_all.STACKS reprend ce nom
+STACK_NAME = "s3-replication-stack"
+SOURCE_BUCKET = "polystudentsbucket"
+REPLICA_BUCKET = "polystudentsbucket-back"
+KMS_KEY_ARN = "arn:aws:kms:ca-central-1:123994170748:key/21987f29-4a5c-494c-a0c0-62191770439b"
+REPLICATION_RULE_ID = "ReplicateToBackupBucket"
+
+# Délai garanti par Replication Time Control (S3 RTC), seule valeur acceptée par S3
+RTC_MINUTES = 15
+
+
+def replication_filter(params):
+    # Préfixe (ReplicationPrefix) et étiquettes (ReplicationTags : {clé: valeur}) des objets à répliquer ;
+    # sans critère, tous les objets
+    prefix = params.get("ReplicationPrefix", "")
+    tags = [TagFilter(Key=key, Value=value) for key, value in sorted(params.get("ReplicationTags", {}).items())]
+    if len(tags) > 1 or (tags and prefix):
+        operator = ReplicationRuleAndOperator(TagFilters=tags)
+        if prefix:
+            operator.Prefix = prefix
+        return ReplicationRuleFilter(And=operator)
+    if tags:
+        return ReplicationRuleFilter(TagFilter=tags[0])
+    return ReplicationRuleFilter(Prefix=prefix)
+
+
+def replication_rule(params):
+    # Règle au schéma V2 (Filter) : seul ce schéma accepte RTC, les métriques et la sélection des objets SSE-KMS
+    destination = ReplicationConfigurationRulesDestination(
+        Bucket=f"arn:aws:s3:::{REPLICA_BUCKET}"
+    )
+    # Marqueurs de suppression répliqués comme avec la règle d'origine (schéma V1), sauf avec un filtre par
+    # étiquettes : S3 ne le permet pas
+    tagged = bool(params.get("ReplicationTags"))
+    replicate_delete_markers = params.get("ReplicationDeleteMarkers", not tagged)
+    if replicate_delete_markers and tagged:
+        raise ValueError("ReplicationDeleteMarkers n'est pas possible avec ReplicationTags")
+    rule = ReplicationConfigurationRules(
+        Id=REPLICATION_RULE_ID,
+        Status="Enabled",
+        Priority=0,
+        Filter=replication_filter(params),
+        DeleteMarkerReplication=DeleteMarkerReplication(
+            Status="Enabled" if replicate_delete_markers else "Disabled"
+        ),
+        Destination=destination
+    )
+
+    # Les objets chiffrés avec une clé KMS ne sont répliqués que s'ils sont explicitement sélectionnés ; la
+    # copie est rechiffrée avec la clé du bucket de destination
+    if params.get("ReplicationKmsEncrypted", True):
+        rule.SourceSelectionCriteria = SourceSelectionCriteria(
+            SseKmsEncryptedObjects=SseKmsEncryptedObjects(Status="Enabled")
+        )
+        destination.EncryptionConfiguration = EncryptionConfiguration(
+            ReplicaKmsKeyID=params.get("ReplicaKmsKeyId", KMS_KEY_ARN)
+        )
+
+    # RTC et les métriques sont facturés en plus : désactivés par défaut. RTC exige les métriques ; elles
+    # peuvent aussi être activées seules (ReplicationLatency, OperationsPendingReplication... dans CloudWatch)
+    rtc = params.get("ReplicationTimeControl", False)
+    if rtc or params.get("ReplicationMetrics", False):
+        destination.Metrics = Metrics(
+            Status="Enabled",
+            EventThreshold=ReplicationTimeValue(Minutes=RTC_MINUTES)
+        )
+    if rtc:
+        destination.ReplicationTime = ReplicationTime(
+            Status="Enabled",
+            Time=ReplicationTimeValue(Minutes=RTC_MINUTES)
+        )
+    return rule
+
+
+def add_replication_alarms(template, params):
+    # Alarmes quand la sauvegarde prend du retard : délai de réplication et opérations en attente. Les
+    # métriques n'existent que si elles sont activées sur la règle
+    latency_threshold = template.add_parameter(
+        Parameter(
+            "ReplicationLatencyThreshold",
+            Type="Number",
+            Description="Replication latency, in seconds, that triggers the alarm",
+            Default=params.get("ReplicationLatencyThreshold", RTC_MINUTES * 60)
+        )
+    )
+
+    pending_threshold = template.add_parameter(
+        Parameter(
+            "ReplicationPendingThreshold",
+            Type="Number",
+            Description="Operations pending replication that trigger the alarm",
+            Default=params.get("ReplicationPendingThreshold", 1000)
+        )
+    )
+
+    dimensions = [
+        MetricDimension(Name="SourceBucket", Value=SOURCE_BUCKET),
+        MetricDimension(Name="DestinationBucket", Value=REPLICA_BUCKET),
+        MetricDimension(Name="RuleId", Value=REPLICATION_RULE_ID),
+    ]
+    alarms = [
+        template.add_resource(Alarm(
+            "ReplicationLatencyAlarm",
+            AlarmDescription=f"Replication from {SOURCE_BUCKET} to {REPLICA_BUCKET} is lagging",
+            Namespace="AWS/S3",
+            MetricName="ReplicationLatency",
+            Dimensions=dimensions,
+            Statistic="Maximum",
+            Period=300,
+            EvaluationPeriods=1,
+            Threshold=Ref(latency_threshold),
+            ComparisonOperator="GreaterThanThreshold",
+            TreatMissingData="notBreaching",
+        )),
+        template.add_resource(Alarm(
+            "ReplicationPendingAlarm",
+            AlarmDescription=f"Too many operations pending replication to {REPLICA_BUCKET}",
+            Namespace="AWS/S3",
+            MetricName="OperationsPendingReplication",
+            Dimensions=dimensions,
+            Statistic="Maximum",
+            Period=300,
+            EvaluationPeriods=2,
+            Threshold=Ref(pending_threshold),
+            ComparisonOperator="GreaterThanThreshold",
+            TreatMissingData="notBreaching",
+        )),
+    ]
+    if params.get("ReplicationAlarmTopicArn"):
+        for alarm in alarms:
+            alarm.AlarmActions = [params["ReplicationAlarmTopicArn"]]
+    return alarms
+
+
+def create_s3_template(params=None):
+    params = params or {}
     template = Template()
     template.set_description("S3 bucket with replication")
 
@@ -31,7 +181,7 @@ def create_s3_template():
             ServerSideEncryptionRule(
                 ServerSideEncryptionByDefault=ServerSideEncryptionByDefault(
                     SSEAlgorithm="aws:kms",
-                    KMSMasterKeyID="arn:aws:kms:ca-central-1:123994170748:key/21987f29-4a5c-494c-a0c0-62191770439b"
+                    KMSMasterKeyID=KMS_KEY_ARN
                 )
             )
         ]
@@ -45,22 +195,24 @@ def create_s3_template():
     # Création du bucket de destination
     destination_bucket = template.add_resource(Bucket(
         "ReplicaBucket",
-        BucketName="polystudentsbucket-back",
+        BucketName=REPLICA_BUCKET,
         AccessControl="Private",
         PublicAccessBlockConfiguration=public_access_block,
         BucketEncryption=encryption,
         VersioningConfiguration=versioning
     ))
+    apply_bucket_profile(destination_bucket, params)
 
     # Création du bucket source
     source_bucket = template.add_resource(Bucket(
         "S3Bucket",
-        BucketName="polystudentsbucket",
+        BucketName=SOURCE_BUCKET,
         AccessControl="Private",
         PublicAccessBlockConfiguration=public_access_block,
         BucketEncryption=encryption,
         VersioningConfiguration=versioning
     ))
+    apply_bucket_profile(source_bucket, params)
 
     # Rôle IAM pour la réplication
     replication_role = template.add_resource(Role(
@@ -93,6 +245,9 @@ def create_s3_template():
                             "Effect": "Allow",
                             "Action": [
                                 "s3:GetObjectVersion",
+                                "s3:GetObjectVersionForReplication",
+                                "s3:GetObjectVersionAcl",
+                                "s3:GetObjectVersionTagging",
                                 "s3:ReplicateObject",
                                 "s3:ReplicateDelete",
                                 "s3:ReplicateTags"
@@ -103,6 +258,28 @@ def create_s3_template():
                             "Effect": "Allow",
                             "Action": "s3:PutObject",
                             "Resource": "*"
+                        },
+                        {
+                            # Déchiffrement des objets SSE-KMS source et rechiffrement des copies, via S3 seulement.
+                            # Avec les Bucket Keys, le contexte de chiffrement est l'ARN du bucket, pas de l'objet
+                            "Effect": "Allow",
+                            "Action": "kms:Decrypt",
+                            "Resource": KMS_KEY_ARN,
+                            "Condition": {
+                                "StringLike": {"kms:EncryptionContext:aws:s3:arn": [
+                                    f"arn:aws:s3:::{SOURCE_BUCKET}", f"arn:aws:s3:::{SOURCE_BUCKET}/*"
+                                ]}
+                            }
+                        },
+                        {
+                            "Effect": "Allow",
+                            "Action": ["kms:Encrypt", "kms:GenerateDataKey"],
+                            "Resource": params.get("ReplicaKmsKeyId", KMS_KEY_ARN),
+                            "Condition": {
+                                "StringLike": {"kms:EncryptionContext:aws:s3:arn": [
+                                    f"arn:aws:s3:::{REPLICA_BUCKET}", f"arn:aws:s3:::{REPLICA_BUCKET}/*"
+                                ]}
+                            }
                         }
                     ]
                 }
@@ -113,20 +290,15 @@ def create_s3_template():
     # Configuration de la réplication
     replication_config = ReplicationConfiguration(
         Role=GetAtt(replication_role, "Arn"),
-        Rules=[
-            ReplicationConfigurationRules(
-                Id="ReplicateToBackupBucket",
-                Status="Enabled",
-                Prefix="",  # Réplication de tous les objets
-                Destination=ReplicationConfigurationRulesDestination(
-                    Bucket=f"arn:aws:s3:::polystudentsbucket-back"
-                )
-            )
-        ]
+        Rules=[replication_rule(params)]
     )
 
     source_bucket.ReplicationConfiguration = replication_config
 
+    # Les alarmes reposent sur les métriques de réplication : elles n'existent qu'avec celles-ci
+    if params.get("ReplicationTimeControl", False) or params.get("ReplicationMetrics", False):
+        add_replication_alarms(template, params)
+
     # Ajout des outputs
     template.add_output(Output(
         "S3Bucket",
@@ -143,24 +315,14 @@ def create_s3_template():
     return template
 
 
-def deploy_template():
-    access_key = 'your_access_key'
-    secret_key = 'your_secret_key'
-    region = 'your_region'
-
-    cf_client = boto3.client('cloudformation', aws_access_key_id=access_key, aws_secret_access_key=secret_key, region_name=region)
+def deploy_template(params=None):
+    cf_client = get_client('cloudformation')
     
-    template = create_s3_template()
+    template = create_s3_template(params)
     
     # Déployer le stack
-    stack_name = "s3-secure-bucket-stack"
-    cf_client.create_stack(
-        StackName=stack_name,
-        TemplateBody=template.to_json(),
-        Capabilities=["CAPABILITY_IAM"]
-    )
-
-    print(f"Déploiement du stack {stack_name} en cours...")
+    stack_name = STACK_NAME
+    deploy_if_changed(cf_client, stack_name, template, capabilities=["CAPABILITY_IAM"])
 
 if __name__ == "__main__":
     deploy_template()
\ No newline at end of file
@@ -1,5 +1,4 @@
-import boto3
-from troposphere import Template, Output, Ref, Join
+from troposphere import Template, Output, Ref, Join, Sub
 from troposphere.s3 import (
     Bucket, 
     BucketPolicy,
@@ -9,9 +8,60 @@ from troposphere.s3 import (
     ServerSideEncryptionByDefault, 
     VersioningConfiguration,
 )
-from troposphere.cloudtrail import Trail, DataResource, EventSelector
+from troposphere.cloudtrail import Trail, AdvancedEventSelector, AdvancedFieldSelector
 
-def create_s3_template():
+from aws_clients import get_client
+from bucket_profile import apply_bucket_profile
+from deploy_cache import deploy_if_changed
+
+
+# Stack déployée par ce script ; deploy_all.STACKS reprend ce nom
+STACK_NAME = "s3-replication-with-cloudtrail-stack"
+SOURCE_BUCKET = "polystudentsbucket"
+DEFAULT_LOG_BUCKET = "polystudentsbucket-trail-logs"
+TRAIL_NAME = "S3ActivityTrail"
+
+# All : lectures et écritures ; WriteOnly : PutObject, DeleteObject... (les GetObject, de loin les plus
+# nombreux, ne sont plus journalisés)
+TRAIL_READ_WRITE_TYPES = ("All", "WriteOnly", "ReadOnly")
+
+
+def trail_event_selectors(params, excluded_path=None):
+    # Sélecteurs avancés : événements de données des objets de polystudentsbucket (ou de certains préfixes).
+    # excluded_path : arborescence où le trail écrit ses propres fichiers (logs et CloudTrail-Digest), seulement
+    # s'il les livre dans polystudentsbucket. Les flow logs VPC, livrés sous AWSLogs/<compte>/vpcflowlogs/,
+    # restent journalisés
+    read_write_type = params.get("TrailReadWriteType", "All")
+    if read_write_type not in TRAIL_READ_WRITE_TYPES:
+        raise ValueError(f"TrailReadWriteType doit être l'un de {', '.join(TRAIL_READ_WRITE_TYPES)}")
+
+    bucket_arn = f"arn:aws:s3:::{SOURCE_BUCKET}/"
+    key_prefixes = params.get("TrailKeyPrefixes") or [""]
+    resources = AdvancedFieldSelector(
+        Field="resources.ARN",
+        StartsWith=[bucket_arn + prefix for prefix in key_prefixes],
+    )
+    if excluded_path:
+        resources.NotStartsWith = [Sub(f"{bucket_arn}{excluded_path}${{AWS::AccountId}}/CloudTrail")]
+    fields = [
+        AdvancedFieldSelector(Field="eventCategory", Equals=["Data"]),
+        AdvancedFieldSelector(Field="resources.type", Equals=["AWS::S3::Object"]),
+        resources,
+    ]
+    if read_write_type != "All":
+        fields.append(AdvancedFieldSelector(Field="readOnly", Equals=[str(read_write_type == "ReadOnly").lower()]))
+
+    selectors = [AdvancedEventSelector(Name="S3ObjectDataEvents", FieldSelectors=fields)]
+    if params.get("TrailManagementEvents", True):
+        selectors.append(AdvancedEventSelector(
+            Name="ManagementEvents",
+            FieldSelectors=[AdvancedFieldSelector(Field="eventCategory", Equals=["Management"])]
+        ))
+    return selectors
+
+
+def create_s3_template(params=None):
+    params = params or {}
     template = Template()
     template.set_description("S3 bucket with replication and CloudTrail logging")
 
@@ -43,12 +93,13 @@ def create_s3_template():
     # Création des buckets
     source_bucket = template.add_resource(Bucket(
         "S3Bucket",
-        BucketName="polystudentsbucket",
+        BucketName=SOURCE_BUCKET,
         AccessControl="Private",
         PublicAccessBlockConfiguration=public_access_block,
         BucketEncryption=encryption,
         VersioningConfiguration=versioning
     ))
+    apply_bucket_profile(source_bucket, params)
 
     destination_bucket = template.add_resource(Bucket(
         "ReplicaBucket",
@@ -58,67 +109,91 @@ def create_s3_template():
         BucketEncryption=encryption,
         VersioningConfiguration=versioning
     ))
+    apply_bucket_profile(destination_bucket, params)
 
-    # Configuration de la politique du bucket pour CloudTrail
-    source_bucket_policy = template.add_resource(BucketPolicy(
-        "S3BucketPolicy",
-        Bucket=Ref(source_bucket),
-        PolicyDocument={
-            "Version": "2012-10-17",
-            "Statement": [
-                {
-                    "Sid": "AWSCloudTrailAclCheck20150319",
-                    "Effect": "Allow",
-                    "Principal": {
-                        "Service": "cloudtrail.amazonaws.com"
-                    },
-                    "Action": [
-                        "s3:GetBucketAcl",
-                        "s3:ListBucket"
-                    ],
-                    "Resource": Join("", ["arn:aws:s3:::", Ref(source_bucket)])
-                },
-                {
-                    "Sid": "AWSCloudTrailWrite20150319",
-                    "Effect": "Allow",
-                    "Principal": {
-                        "Service": "cloudtrail.amazonaws.com"
+    # Bucket des logs du trail : dédié par défaut (TrailLogBucketName pour en fournir un existant). Livrés dans
+    # polystudentsbucket, chaque fichier du trail serait lui-même un événement de données journalisé
+    log_bucket_name = params.get("TrailLogBucketName")
+    key_prefix = params.get("TrailS3KeyPrefix", "")
+    log_path = f"{key_prefix}/AWSLogs/" if key_prefix else "AWSLogs/"
+    # Préfixe à exclure des événements journalisés, seulement si le trail écrit dans le bucket qu'il surveille
+    excluded_path = None
+
+    if log_bucket_name is None:
+        log_bucket = template.add_resource(Bucket(
+            "TrailLogBucket",
+            BucketName=DEFAULT_LOG_BUCKET,
+            AccessControl="Private",
+            PublicAccessBlockConfiguration=public_access_block,
+            BucketEncryption=encryption,
+            VersioningConfiguration=versioning
+        ))
+        apply_bucket_profile(log_bucket, params)
+        log_bucket_name = Ref(log_bucket)
+        policy_name = "TrailLogBucketPolicy"
+    elif log_bucket_name == SOURCE_BUCKET:
+        log_bucket_name = Ref(source_bucket)
+        policy_name = "S3BucketPolicy"
+        excluded_path = log_path
+    else:
+        # Bucket existant géré ailleurs : sa politique doit déjà autoriser CloudTrail
+        policy_name = None
+
+    depends_on = []
+    if policy_name:
+        # Configuration de la politique du bucket pour CloudTrail
+        template.add_resource(BucketPolicy(
+            policy_name,
+            Bucket=log_bucket_name,
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Sid": "AWSCloudTrailAclCheck20150319",
+                        "Effect": "Allow",
+                        "Principal": {
+                            "Service": "cloudtrail.amazonaws.com"
+                        },
+                        "Action": [
+                            "s3:GetBucketAcl",
+                            "s3:ListBucket"
+                        ],
+                        "Resource": Join("", ["arn:aws:s3:::", log_bucket_name])
                     },
-                    "Action": "s3:PutObject",
-                    "Resource": Join("", ["arn:aws:s3:::", Ref(source_bucket), "/AWSLogs/*"]),
-                    "Condition": {
-                        "StringEquals": {
-                            "s3:x-amz-acl": "bucket-owner-full-control"
+                    {
+                        "Sid": "AWSCloudTrailWrite20150319",
+                        "Effect": "Allow",
+                        "Principal": {
+                            "Service": "cloudtrail.amazonaws.com"
+                        },
+                        "Action": "s3:PutObject",
+                        "Resource": Join("", ["arn:aws:s3:::", log_bucket_name, f"/{log_path}*"]),
+                        "Condition": {
+                            "StringEquals": {
+                                "s3:x-amz-acl": "bucket-owner-full-control"
+                            }
                         }
                     }
-                }
-            ]
-        }
-    ))
+                ]
+            }
+        ))
+        # CloudTrail vérifie la politique à la création du trail
+        depends_on.append(policy_name)
 
     # Enable CloudTrail to log S3 data events
     cloudtrail = template.add_resource(Trail(
         "CloudTrail",
-        TrailName="S3ActivityTrail",
-        S3BucketName=Ref(source_bucket),
+        TrailName=TRAIL_NAME,
+        S3BucketName=log_bucket_name,
         IsLogging=True,
         IsMultiRegionTrail=True,
         IncludeGlobalServiceEvents=True,
-        EventSelectors=[
-            EventSelector(
-                ReadWriteType="All",
-                IncludeManagementEvents=True,
-                DataResources=[
-                    DataResource(
-                        Type="AWS::S3::Object",
-                        Values=[
-                            Join("", ["arn:aws:s3:::", Ref(source_bucket), "/"]),
-                        ]
-                    )
-                ]
-            )
-        ]
+        AdvancedEventSelectors=trail_event_selectors(params, excluded_path)
     ))
+    if key_prefix:
+        cloudtrail.S3KeyPrefix = key_prefix
+    if depends_on:
+        cloudtrail.DependsOn = depends_on
 
     # Ajout des outputs
     template.add_output([
@@ -131,30 +206,25 @@ def create_s3_template():
             "CloudTrailName",
             Description="CloudTrail Name for S3 Activity Logging",
             Value=Ref(cloudtrail)
+        ),
+        Output(
+            "TrailLogBucketName",
+            Description="Bucket receiving the CloudTrail log files",
+            Value=log_bucket_name
         )
     ])
 
     return template
 
 
-def deploy_template():
-    access_key = 'your_access_key'
-    secret_key = 'your_secret_key'
-    region = 'your_region'
-
-    cf_client = boto3.client('cloudformation', aws_access_key_id=access_key, aws_secret_access_key=secret_key, region_name=region)
+def deploy_template(params=None):
+    cf_client = get_client('cloudformation')
     
-    template = create_s3_template()
+    template = create_s3_template(params)
     
     # Déployer le stack
-    stack_name = "s3-replication-with-cloudtrail-stack"
-    cf_client.create_stack(
-        StackName=stack_name,
-        TemplateBody=template.to_json(),
-        Capabilities=["CAPABILITY_IAM"]
-    )
-
-    print(f"Déploiement du stack {stack_name} en cours...")
+    stack_name = STACK_NAME
+    deploy_if_changed(cf_client, stack_name, template, capabilities=["CAPABILITY_IAM"])
 
 if __name__ == "__main__":
     deploy_template()
\ No newline at end of file
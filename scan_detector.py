@@ -0,0 +1,354 @@
+import argparse
+import datetime
+import math
+import zlib
+
+import numpy as np
+
+from flow_aggregates import DEFAULT_WINDOW, MISSING
+from flow_logs import DEFAULT_BUCKET, scan
+from subnet_index import ipv4_integers
+
+
+# Ports d'authentification ouverts par polystudent-sg (SSH, RDP, MSSQL, MySQL, PostgreSQL)
+AUTH_PORTS = (22, 3389, 1433, 3306, 5432)
+
+# Seuils d'alerte sur une fenêtre
+VERTICAL_SCAN_PORTS = 20       # ports distincts visés par une même source
+HORIZONTAL_SCAN_HOSTS = 20     # adresses distinctes visées par une même source
+BRUTE_FORCE_ATTEMPTS = 30      # flux d'une même source vers un même port d'authentification
+
+# Part minimale du trafic de la source : un gros client légitime a aussi quelques rejets et beaucoup de
+# connexions SSH, mais noyés dans le reste de son trafic
+SCAN_REJECT_SHARE = 0.5        # rejets / flux de la source
+BRUTE_FORCE_SHARE = 0.5        # tentatives sur le port / flux de la source
+
+KINDS = ("vertical_scan", "horizontal_scan", "brute_force")
+
+# Taille des structures : tout est alloué à la création, la mémoire ne dépend pas du nombre de sources
+SKETCH_DEPTH = 4
+SKETCH_WIDTH = 1 << 14
+HLL_PRECISION = 7
+MAX_TRACKED = 10000
+SLICES = 4
+BATCH_SIZE = 10000
+
+# Retard accepté sur l'ordre des enregistrements : un fichier de flow logs couvre tout son intervalle
+# d'agrégation et les lectures parallèles entrelacent plusieurs fichiers. Au-delà, un enregistrement est ignoré
+# et compté dans detector["late"]
+DEFAULT_LATENESS = DEFAULT_WINDOW
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+# Tranche de la dernière alerte d'une source qui n'en a jamais eu
+NEVER = np.iinfo(np.int64).min // 2
+
+
+def _mix(values, salt):
+    # splitmix64 vectorisé : hachage rapide et bien réparti d'entiers 64 bits
+    with np.errstate(over="ignore"):
+        x = values.astype(np.uint64) + np.uint64((0x9E3779B97F4A7C15 * (salt + 1)) & 0xFFFFFFFFFFFFFFFF)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return (x ^ (x >> np.uint64(31))) & _MASK64
+
+
+def _address_keys(addresses):
+    # Clé entière par adresse : l'adresse elle-même en IPv4, un CRC au-delà de 2^32 pour les autres. Chaque
+    # adresse distincte du lot n'est convertie qu'une fois
+    index = {}
+    codes = np.array([index.setdefault(address, len(index)) for address in addresses], dtype=np.int64)
+    distinct = list(index)
+    keys = ipv4_integers(distinct)
+    for i in np.flatnonzero(keys < 0):
+        if distinct[i] is not None:
+            keys[i] = (1 << 32) + zlib.crc32(str(distinct[i]).encode("utf-8"))
+    return keys[codes] if len(codes) else keys
+
+
+def new_detector(window=DEFAULT_WINDOW, slices=SLICES, max_tracked=MAX_TRACKED, depth=SKETCH_DEPTH,
+                 width=SKETCH_WIDTH, precision=HLL_PRECISION, lateness=DEFAULT_LATENESS):
+    # Fenêtre glissante découpée en `slices` tranches ; chaque tranche a ses propres sketchs, remis à zéro quand
+    # elle est réutilisée. L'anneau garde en plus les tranches couvrant `lateness` secondes : un enregistrement
+    # en retard est compté dans sa tranche et évalué sur la fenêtre qui se termine à celle-ci. Les sources
+    # suivies (au plus max_tracked) ont chacune deux HyperLogLog par tranche : ports distincts (scan vertical)
+    # et adresses distinctes (scan horizontal) des flux rejetés
+    registers = 1 << precision
+    slice_seconds = max(window // slices, 1)
+    ring = slices + math.ceil(lateness / slice_seconds)
+    return {
+        "window": window,
+        "slices": slices,
+        "ring": ring,
+        "slice_seconds": slice_seconds,
+        "precision": precision,
+        "slice_ids": np.full(ring, MISSING, dtype=np.int64),
+        "latest": MISSING,
+        "late": 0,
+        "flows": np.zeros((ring, depth, width), dtype=np.uint32),
+        "rejects": np.zeros((ring, depth, width), dtype=np.uint32),
+        "attempts": np.zeros((ring, depth, width), dtype=np.uint32),
+        "slots": {},
+        "keys": np.full(max_tracked, MISSING, dtype=np.int64),
+        "sources": [None] * max_tracked,
+        "ports": np.zeros((max_tracked, ring, registers), dtype=np.uint8),
+        "hosts": np.zeros((max_tracked, ring, registers), dtype=np.uint8),
+        "alerted": np.full((max_tracked, len(KINDS)), NEVER, dtype=np.int64),
+    }
+
+
+def _active(detector, end):
+    # Positions dans l'anneau des tranches de la fenêtre qui se termine à la tranche `end`
+    slice_ids = detector["slice_ids"]
+    return np.flatnonzero((slice_ids > end - detector["slices"]) & (slice_ids <= end))
+
+
+def _sketch_indexes(keys, depth, width):
+    return np.stack([(_mix(keys, row) % np.uint64(width)).astype(np.int64) for row in range(depth)])
+
+
+def _sketch_add(sketch, rings, keys):
+    depth, width = sketch.shape[1:]
+    indexes = _sketch_indexes(keys, depth, width)
+    for row in range(depth):
+        np.add.at(sketch, (rings, row, indexes[row]), 1)
+
+
+def _sketch_estimate(detector, sketch, keys, end):
+    # Count-min : somme des tranches de la fenêtre, puis minimum sur les lignes (surestimation bornée)
+    depth, width = sketch.shape[1:]
+    active = _active(detector, end)
+    if not len(keys) or not len(active):
+        return np.zeros(len(keys), dtype=np.int64)
+    indexes = _sketch_indexes(keys, depth, width)
+    counts = np.stack([sketch[active, row][:, indexes[row]].sum(axis=0) for row in range(depth)])
+    return counts.min(axis=0).astype(np.int64)
+
+
+def _hll_add(registers, slots, rings, values, precision):
+    hashed = _mix(values, 97)
+    index = (hashed >> np.uint64(64 - precision)).astype(np.int64)
+    # Rang du premier bit à 1 dans 32 bits du hachage ; frexp donne la longueur en bits exactement
+    rest = (hashed & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    rank = (33 - np.frexp(rest)[1]).astype(np.uint8)
+    np.maximum.at(registers, (slots, rings, index), rank)
+
+
+def _hll_estimate(detector, registers, slots, end):
+    # Estimation HyperLogLog sur l'union des tranches de la fenêtre (maximum registre par registre)
+    active = _active(detector, end)
+    merged = registers[slots][:, active].max(axis=1).astype(np.float64)
+    m = merged.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.power(2.0, -merged).sum(axis=1)
+    zeros = (merged == 0).sum(axis=1)
+    small = (estimate <= 2.5 * m) & (zeros > 0)
+    estimate[small] = m * np.log(m / zeros[small])
+    return estimate
+
+
+def _rotate(detector, slice_ids):
+    # Avance la fenêtre ; une tranche réutilisée est vidée avant de recevoir ses nouveaux enregistrements. Les
+    # enregistrements plus anciens que l'anneau sont écartés et comptés
+    detector["latest"] = max(detector["latest"], int(slice_ids.max()))
+    valid = slice_ids > detector["latest"] - detector["ring"]
+    detector["late"] += int(len(valid) - valid.sum())
+    for slice_id in np.unique(slice_ids[valid]):
+        ring = slice_id % detector["ring"]
+        if detector["slice_ids"][ring] != slice_id:
+            detector["slice_ids"][ring] = slice_id
+            detector["flows"][ring] = 0
+            detector["rejects"][ring] = 0
+            detector["attempts"][ring] = 0
+            detector["ports"][:, ring] = 0
+            detector["hosts"][:, ring] = 0
+    return valid
+
+
+def _admit(detector, keys, sources):
+    # Suit les nouvelles sources tant qu'il reste de la place, puis remplace les sources suivies les moins
+    # rejetées quand un nouveau venu l'est davantage (éviction type space-saving)
+    slots = detector["slots"]
+    new = np.array([key for key in np.unique(keys) if key not in slots], dtype=np.int64)
+    if not len(new):
+        return
+    free = np.flatnonzero(detector["keys"] == MISSING)
+    estimates = _sketch_estimate(detector, detector["rejects"], new, detector["latest"])
+    new = new[np.argsort(-estimates, kind="stable")]
+    estimates = np.sort(estimates)[::-1]
+
+    placed = min(len(free), len(new))
+    targets = list(free[:placed])
+    if placed < len(new):
+        tracked = np.flatnonzero(detector["keys"] != MISSING)
+        tracked_estimates = _sketch_estimate(
+            detector, detector["rejects"], detector["keys"][tracked], detector["latest"]
+        )
+        order = np.argsort(tracked_estimates, kind="stable")
+        for i, slot in enumerate(order[:len(new) - placed]):
+            if estimates[placed + i] <= tracked_estimates[slot]:
+                break
+            targets.append(tracked[slot])
+
+    source_of = dict(zip(keys.tolist(), sources))
+    for key, slot in zip(new[:len(targets)].tolist(), targets):
+        old = detector["keys"][slot]
+        if old != MISSING:
+            del slots[int(old)]
+        slots[key] = slot
+        detector["keys"][slot] = key
+        detector["sources"][slot] = source_of[key]
+        detector["ports"][slot] = 0
+        detector["hosts"][slot] = 0
+        detector["alerted"][slot] = NEVER
+
+
+def update(detector, srcaddr, dstaddr, dstport, action, start):
+    # Intègre un lot d'enregistrements (tableaux alignés) et retourne les alertes qu'il déclenche
+    srcaddr = np.asarray(srcaddr, dtype=object)
+    dstport = np.asarray(dstport, dtype=np.int64)
+    start = np.asarray(start, dtype=np.int64)
+    if not len(srcaddr):
+        return []
+
+    known = start >= 0
+    slice_ids = np.where(known, start // detector["slice_seconds"], max(detector["latest"], 0))
+    valid = _rotate(detector, slice_ids) & np.not_equal(srcaddr, None)
+    if not valid.any():
+        return []
+    srcaddr = srcaddr[valid]
+    dstport = dstport[valid]
+    slice_ids = slice_ids[valid]
+    rings = slice_ids % detector["ring"]
+    src_keys = _address_keys(srcaddr)
+    dst_keys = _address_keys(np.asarray(dstaddr, dtype=object)[valid])
+    rejected = np.asarray(action, dtype=object)[valid] == "REJECT"
+
+    _sketch_add(detector["flows"], rings, src_keys)
+    _sketch_add(detector["rejects"], rings[rejected], src_keys[rejected])
+    auth = np.isin(dstport, AUTH_PORTS)
+    attempt_keys = src_keys * 65536 + dstport
+    _sketch_add(detector["attempts"], rings[auth], attempt_keys[auth])
+
+    # Seules les sources qui rejettent ou s'authentifient méritent une place parmi les sources suivies
+    interesting = rejected | auth
+    _admit(detector, src_keys[interesting], srcaddr[interesting].tolist())
+
+    # Les HLL ne comptent que les cibles refusées : un client légitime qui varie ses ports autorisés
+    # (ex. : 9200-9300) n'est pas un scan
+    slots = detector["slots"]
+    slot = np.array([slots.get(key, MISSING) for key in src_keys.tolist()], dtype=np.int64)
+    tracked = (slot >= 0) & rejected
+    _hll_add(detector["ports"], slot[tracked], rings[tracked], dstport[tracked], detector["precision"])
+    _hll_add(detector["hosts"], slot[tracked], rings[tracked], dst_keys[tracked], detector["precision"])
+
+    # Chaque tranche reçue est évaluée sur la fenêtre qui se termine à elle : un enregistrement en retard est
+    # jugé avec ses contemporains, pas avec les plus récents
+    alerts = []
+    for end in np.unique(slice_ids).tolist():
+        in_slice = slice_ids == end
+        alerts += _alerts(
+            detector, end, np.unique(slot[tracked & in_slice]), src_keys[in_slice], dstport[in_slice],
+            auth[in_slice],
+        )
+    return alerts
+
+
+def _alerts(detector, end, touched, src_keys, dstport, auth):
+    alerts = []
+    window_end = (end + 1) * detector["slice_seconds"]
+
+    def raise_alert(slot, kind, **details):
+        # Une alerte par source et par type au plus une fois par fenêtre
+        k = KINDS.index(kind)
+        if abs(end - detector["alerted"][slot, k]) < detector["slices"]:
+            return
+        detector["alerted"][slot, k] = end
+        alerts.append(dict(kind=kind, srcaddr=detector["sources"][slot], window_end=int(window_end), **details))
+
+    if len(touched):
+        keys = detector["keys"][touched]
+        flows = _sketch_estimate(detector, detector["flows"], keys, end)
+        rejects = _sketch_estimate(detector, detector["rejects"], keys, end)
+        ports = _hll_estimate(detector, detector["ports"], touched, end)
+        hosts = _hll_estimate(detector, detector["hosts"], touched, end)
+        scanning = rejects >= SCAN_REJECT_SHARE * flows
+        for slot, is_scanning, count, distinct_ports, distinct_hosts in zip(
+            touched.tolist(), scanning, rejects.tolist(), ports, hosts
+        ):
+            if not is_scanning:
+                continue
+            if distinct_ports >= VERTICAL_SCAN_PORTS:
+                raise_alert(slot, "vertical_scan", distinct_ports=int(round(distinct_ports)), rejects=count)
+            if distinct_hosts >= HORIZONTAL_SCAN_HOSTS:
+                raise_alert(slot, "horizontal_scan", distinct_hosts=int(round(distinct_hosts)), rejects=count)
+
+    if auth.any():
+        pairs = np.unique(np.stack([src_keys[auth], dstport[auth]], axis=1), axis=0)
+        attempts = _sketch_estimate(detector, detector["attempts"], pairs[:, 0] * 65536 + pairs[:, 1], end)
+        flows = _sketch_estimate(detector, detector["flows"], pairs[:, 0], end)
+        slots = detector["slots"]
+        for (key, port), count, total in zip(pairs.tolist(), attempts.tolist(), flows.tolist()):
+            if count >= BRUTE_FORCE_ATTEMPTS and count >= BRUTE_FORCE_SHARE * total and key in slots:
+                raise_alert(slots[key], "brute_force", dstport=port, attempts=count)
+    return alerts
+
+
+def process(detector, records, batch_size=BATCH_SIZE):
+    # Flux d'enregistrements (dicts de flow_logs) traité par lots ; produit les alertes au fil de l'eau
+    def flush(batch):
+        return update(
+            detector,
+            [r.get("srcaddr") for r in batch],
+            [r.get("dstaddr") for r in batch],
+            [MISSING if r.get("dstport") is None else r["dstport"] for r in batch],
+            [r.get("action") for r in batch],
+            [MISSING if r.get("start") is None else r["start"] for r in batch],
+        )
+
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield from flush(batch)
+            batch = []
+    if batch:
+        yield from flush(batch)
+
+
+def memory_bytes(detector):
+    return sum(value.nbytes for value in detector.values() if isinstance(value, np.ndarray))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Détection de scans de ports et de force brute dans les flow logs")
+    parser.add_argument("--bucket", default=DEFAULT_BUCKET)
+    parser.add_argument("--account")
+    parser.add_argument("--region")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="Intervalle d'agrégation, en secondes")
+    parser.add_argument(
+        "--lateness", type=int, default=DEFAULT_LATENESS,
+        help="Retard accepté sur l'ordre des enregistrements, en secondes (plus de mémoire si plus grand)",
+    )
+    parser.add_argument("--cache", action="store_true", help="Copie locale des objets pour les analyses répétées")
+    args = parser.parse_args()
+
+    detector = new_detector(args.window, lateness=args.lateness)
+    records = scan(
+        args.bucket, args.start, args.end, args.account, args.region,
+        columns={"srcaddr", "dstaddr", "dstport", "action", "start"}, cache=args.cache,
+    )
+    for alert in process(detector, records):
+        end = datetime.datetime.fromtimestamp(alert["window_end"], datetime.timezone.utc)
+        details = ", ".join(f"{key}={value}" for key, value in alert.items()
+                            if key not in ("kind", "srcaddr", "window_end"))
+        print(f"{end:%Y-%m-%d %H:%M}  {alert['kind']:<16} {alert['srcaddr']:<40} {details}")
+    print(f"Mémoire des sketchs : {memory_bytes(detector) / 1024 ** 2:.1f} Mo")
+    if detector["late"]:
+        print(f"{detector['late']} enregistrements trop en retard ignorés : augmenter --lateness")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import argparse
+import datetime
+import ipaddress
+
+import numpy as np
+
+from flow_aggregates import DEFAULT_COLUMNS, MISSING, PROTOCOLS, aggregate, load_table, rows
+from flow_logs import DEFAULT_BUCKET, scan
+from network import DEFAULT_VPC_CIDR, ingress_rules
+from subnet_index import ipv4_integers
+
+
+PROTOCOL_NUMBERS = {name: number for number, name in PROTOCOLS.items()}
+PROTOCOL_NUMBERS["icmpv6"] = 58
+
+# Intervalle de ports couvrant tout, y compris les flux sans port (ICMP, NODATA)
+ALL_PORTS = (MISSING, 65535)
+
+# Verdicts de classify_table, dans l'ordre des codes
+VERDICTS = (
+    "outbound",                 # flux sortant de l'interface : les règles d'entrée ne s'appliquent pas
+    "accepted",                 # accepté et autorisé par une règle
+    "accepted_outside_policy",  # accepté sans règle correspondante (trafic retour, autre groupe de sécurité)
+    "sg_default_deny",          # rejeté faute de règle : refus par défaut du groupe de sécurité
+    "nacl_reject",              # rejeté alors qu'une règle l'autorise : refus venant de l'ACL réseau
+    "no_data",                  # enregistrement NODATA / SKIPDATA
+)
+
+
+def _protocol(rule):
+    protocol = str(rule.get("IpProtocol", "-1")).lower()
+    if protocol in ("-1", "all"):
+        return None
+    return PROTOCOL_NUMBERS.get(protocol, int(protocol) if protocol.isdigit() else protocol)
+
+
+def _port_range(rule, protocol):
+    # Pour ICMP, FromPort/ToPort sont le type et le code, absents des flow logs : la règle couvre tout
+    from_port = rule.get("FromPort", -1)
+    if protocol is None or protocol in (1, 58) or from_port == -1:
+        return ALL_PORTS
+    return int(from_port), int(rule.get("ToPort", from_port))
+
+
+def _address_ranges(cidrs):
+    # CIDR fusionnés en intervalles d'adresses disjoints et triés : une recherche dichotomique remplace le
+    # parcours d'un arbre de préfixes
+    networks = list(ipaddress.collapse_addresses(ipaddress.ip_network(cidr) for cidr in cidrs))
+    starts = np.array([int(network.network_address) for network in networks], dtype=np.int64)
+    ends = np.array([int(network.broadcast_address) for network in networks], dtype=np.int64)
+    return starts, ends
+
+
+def _port_segments(rules, cidr_sets):
+    # Découpe les ports en segments élémentaires ; chaque segment reçoit l'ensemble des CIDR des règles qui le
+    # couvrent (un numéro dans cidr_sets, -1 si aucune règle)
+    bounds = sorted({port for from_port, to_port, _ in rules for port in (from_port, to_port + 1)})
+    sets = []
+    for start in bounds[:-1]:
+        cidrs = frozenset(cidr for from_port, to_port, cidr in rules if from_port <= start <= to_port)
+        sets.append(cidr_sets.setdefault(cidrs, len(cidr_sets)) if cidrs else -1)
+    return {"bounds": np.array(bounds, dtype=np.int64), "sets": np.array(sets, dtype=np.int64)}
+
+
+def compile_rules(rules=ingress_rules):
+    # Compile des règles d'entrée (format SecurityGroupIngress) en tables de recherche par protocole. Seules les
+    # règles IPv4 par CIDR sont prises en compte : les règles par groupe source ne se résolvent pas hors ligne
+    by_protocol = {}
+    any_protocol = []
+    for rule in rules:
+        if "CidrIp" not in rule:
+            continue
+        protocol = _protocol(rule)
+        from_port, to_port = _port_range(rule, protocol)
+        entry = (from_port, to_port, rule["CidrIp"])
+        if protocol is None:
+            any_protocol.append(entry)
+        else:
+            by_protocol.setdefault(protocol, []).append(entry)
+
+    cidr_sets = {}
+    protocols = {
+        protocol: _port_segments(entries + any_protocol, cidr_sets)
+        for protocol, entries in by_protocol.items()
+    }
+    # Les protocoles sans règle propre ne sont autorisés que par les règles "-1"
+    other = _port_segments(any_protocol, cidr_sets) if any_protocol else None
+
+    ranges = [None] * len(cidr_sets)
+    for cidrs, i in cidr_sets.items():
+        ranges[i] = _address_ranges(cidrs)
+    return {"protocols": protocols, "other": other, "cidr_sets": ranges}
+
+
+def _segment_sets(segments, ports):
+    position = np.searchsorted(segments["bounds"], ports, side="right") - 1
+    inside = (position >= 0) & (position < len(segments["sets"]))
+    return np.where(inside, segments["sets"][np.clip(position, 0, max(len(segments["sets"]) - 1, 0))], -1)
+
+
+def allowed(policy, protocols, ports, addresses):
+    # Vectorisé : True pour chaque flux entrant (protocole, port de destination, adresse source IPv4 en entier)
+    # qu'une règle autorise. Les adresses à -1 (IPv6, absentes) ne correspondent à aucune règle
+    protocols = np.asarray(protocols)
+    ports = np.asarray(ports)
+    addresses = np.asarray(addresses, dtype=np.int64)
+    set_ids = np.full(len(ports), -1, dtype=np.int64)
+
+    for protocol, segments in policy["protocols"].items():
+        mask = protocols == protocol
+        set_ids[mask] = _segment_sets(segments, ports[mask])
+    if policy["other"] is not None:
+        mask = ~np.isin(protocols, list(policy["protocols"]))
+        set_ids[mask] = _segment_sets(policy["other"], ports[mask])
+
+    result = np.zeros(len(ports), dtype=bool)
+    for i, (starts, ends) in enumerate(policy["cidr_sets"]):
+        mask = set_ids == i
+        candidates = addresses[mask]
+        position = np.searchsorted(starts, candidates, side="right") - 1
+        result[mask] = (candidates >= 0) & (position >= 0) & (candidates <= ends[np.clip(position, 0, None)])
+    return result
+
+
+def classify_table(table, policy=None, vpc_cidr=DEFAULT_VPC_CIDR):
+    # Ajoute à une table de flow_aggregates les colonnes "allowed" (0/1) et "verdict" (code dans VERDICTS).
+    # Un flux est entrant si sa destination est dans le VPC ; les adresses ne sont converties qu'une fois par
+    # valeur distincte, puis diffusées aux enregistrements par leurs codes
+    policy = policy or compile_rules()
+    columns = table["columns"]
+    categories = table["categories"]
+
+    sources = ipv4_integers(categories["srcaddr"])[columns["srcaddr"]]
+    destinations = ipv4_integers(categories["dstaddr"])[columns["dstaddr"]]
+    vpc = ipaddress.ip_network(vpc_cidr)
+    inbound = (destinations >= int(vpc.network_address)) & (destinations <= int(vpc.broadcast_address))
+
+    permitted = allowed(policy, columns["protocol"], columns["dstport"], sources)
+    actions = categories["action"][columns["action"]]
+    accepted = actions == "ACCEPT"
+    rejected = actions == "REJECT"
+
+    verdict = np.full(table["size"], VERDICTS.index("no_data"), dtype=np.int8)
+    verdict[accepted & permitted] = VERDICTS.index("accepted")
+    verdict[accepted & ~permitted] = VERDICTS.index("accepted_outside_policy")
+    verdict[rejected & ~permitted] = VERDICTS.index("sg_default_deny")
+    verdict[rejected & permitted] = VERDICTS.index("nacl_reject")
+    verdict[(accepted | rejected) & ~inbound] = VERDICTS.index("outbound")
+
+    return {
+        "size": table["size"],
+        "columns": dict(columns, allowed=permitted.astype(np.int8), verdict=verdict),
+        "categories": dict(categories, verdict=np.array(VERDICTS, dtype=object)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classement des flux selon les règles de polystudent-sg")
+    parser.add_argument("--bucket", default=DEFAULT_BUCKET)
+    parser.add_argument("--account")
+    parser.add_argument("--region")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--vpc-cidr", default=DEFAULT_VPC_CIDR)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--cache", action="store_true", help="Copie locale des objets pour les analyses répétées")
+    args = parser.parse_args()
+
+    records = scan(
+        args.bucket, args.start, args.end, args.account, args.region, columns=set(DEFAULT_COLUMNS), cache=args.cache,
+    )
+    table = classify_table(load_table(records), vpc_cidr=args.vpc_cidr)
+
+    result = aggregate(table, ("verdict",))
+    for row in rows(table, result, np.argsort(-result["flows"])):
+        print(f"{row['verdict']:<25} {row['flows']:>10} flux")
+
+    # Ports visés par les rejets que le groupe de sécurité aurait lui aussi refusés, et inversement
+    for verdict in ("sg_default_deny", "nacl_reject"):
+        mask = table["columns"]["verdict"] == VERDICTS.index(verdict)
+        result = aggregate(table, ("dstport", "protocol"), mask)
+        print(f"\n{verdict} :")
+        for row in rows(table, result, np.argsort(-result["flows"])[:args.top]):
+            protocol = PROTOCOLS.get(row["protocol"], row["protocol"])
+            print(f"  {row['dstport']:>5}/{protocol:<5} {row['flows']:>8} flux")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import ipaddress
+import re
+import socket
+
+import numpy as np
+
+from aws_clients import get_client
+from network import DEFAULT_AZ_COUNT, DEFAULT_VPC_CIDR, carve_subnets
+
+
+DEFAULT_STACK = "PolyStack"
+
+SUBNET_OUTPUT = re.compile(r"^(Public|Private)Subnet(\d+)$")
+
+
+def ipv4_integers(addresses):
+    # Adresses IPv4 en entiers, -1 pour les autres (IPv6, None). inet_aton est bien plus rapide que ipaddress ;
+    # les adresses des flow logs sont toujours en notation pointée complète
+    integers = np.full(len(addresses), -1, dtype=np.int64)
+    for i, address in enumerate(addresses):
+        try:
+            integers[i] = int.from_bytes(socket.inet_aton(address), "big")
+        except (OSError, TypeError):
+            pass
+    return integers
+
+
+def build_index(entries):
+    # Index de correspondance du plus long préfixe. entries : dicts avec "cidr", "name", "az" et "tier". Les
+    # préfixes (éventuellement imbriqués, ex. : sous-réseaux dans le VPC) sont aplatis en intervalles disjoints
+    # triés, chacun attribué au préfixe le plus long qui le couvre : une recherche se fait alors par dichotomie
+    networks = [ipaddress.IPv4Network(entry["cidr"]) for entry in entries]
+    bounds = sorted(
+        {int(network.network_address) for network in networks}
+        | {int(network.broadcast_address) + 1 for network in networks}
+    )
+
+    labels = []
+    for start in bounds[:-1]:
+        best = -1
+        for i, network in enumerate(networks):
+            inside = int(network.network_address) <= start <= int(network.broadcast_address)
+            if inside and (best == -1 or network.prefixlen > networks[best].prefixlen):
+                best = i
+        labels.append(best)
+
+    return {
+        "bounds": np.array(bounds, dtype=np.int64),
+        "labels": np.array(labels, dtype=np.int64),
+        "entries": list(entries),
+    }
+
+
+def lookup(index, addresses):
+    # Vectorisé : numéro de l'entrée (préfixe le plus long) de chaque adresse IPv4 entière, -1 si aucune
+    addresses = np.asarray(addresses, dtype=np.int64)
+    if not len(index["labels"]):
+        return np.full(len(addresses), -1, dtype=np.int64)
+    position = np.searchsorted(index["bounds"], addresses, side="right") - 1
+    inside = (addresses >= 0) & (position >= 0) & (position < len(index["labels"]))
+    return np.where(inside, index["labels"][np.clip(position, 0, len(index["labels"]) - 1)], -1)
+
+
+def index_from_params(params=None):
+    # Sous-réseaux tels que le template les découpe (VpcCIDR, AZCount). Hors ligne, la zone est le rang de l'AZ
+    # dans GetAZs ; le VPC entier sert de repli pour les adresses hors sous-réseau
+    params = params or {}
+    vpc_cidr = params.get("VpcCIDR", DEFAULT_VPC_CIDR)
+    carved = carve_subnets(vpc_cidr, int(params.get("AZCount", DEFAULT_AZ_COUNT)))
+
+    entries = [{"cidr": vpc_cidr, "name": "VPC", "az": None, "tier": "vpc"}]
+    for tier, cidrs in carved.items():
+        for az, cidr in enumerate(cidrs, start=1):
+            entries.append({"cidr": cidr, "name": f"{tier}Subnet{az}", "az": f"AZ{az}", "tier": tier.lower()})
+    return build_index(entries)
+
+
+def index_from_stack(stack_name=DEFAULT_STACK, region=None):
+    # Sous-réseaux réellement déployés : les outputs de la stack donnent leurs ID, EC2 leurs CIDR et AZ
+    outputs = {
+        output["OutputKey"]: output["OutputValue"]
+        for output in get_client("cloudformation", region).describe_stacks(StackName=stack_name)["Stacks"][0]
+        .get("Outputs", [])
+    }
+    subnet_names = {value: key for key, value in outputs.items() if SUBNET_OUTPUT.match(key)}
+
+    ec2 = get_client("ec2", region)
+    entries = []
+    if "VPC" in outputs:
+        for vpc in ec2.describe_vpcs(VpcIds=[outputs["VPC"]])["Vpcs"]:
+            for association in vpc.get("CidrBlockAssociationSet", [{"CidrBlock": vpc["CidrBlock"]}]):
+                entries.append({"cidr": association["CidrBlock"], "name": "VPC", "az": None, "tier": "vpc"})
+    if subnet_names:
+        for subnet in ec2.describe_subnets(SubnetIds=list(subnet_names))["Subnets"]:
+            name = subnet_names[subnet["SubnetId"]]
+            entries.append({
+                "cidr": subnet["CidrBlock"],
+                "name": name,
+                "az": subnet["AvailabilityZone"],
+                "tier": SUBNET_OUTPUT.match(name).group(1).lower(),
+            })
+    return build_index(entries)
+
+
+def enrich_table(table, index, fields=("srcaddr", "dstaddr")):
+    # Ajoute à une table de flow_aggregates, pour chaque champ d'adresse, les colonnes factorisées
+    # "<src|dst>-subnet", "-az" et "-tier". La recherche ne porte que sur les adresses distinctes ; le résultat
+    # est diffusé aux enregistrements par leurs codes
+    columns = dict(table["columns"])
+    categories = dict(table["categories"])
+    missing = len(index["entries"])
+
+    for field in fields:
+        found = lookup(index, ipv4_integers(categories[field]))
+        entries = np.where(found >= 0, found, missing)[columns[field]]
+        for attribute, suffix in (("name", "subnet"), ("az", "az"), ("tier", "tier")):
+            # Une catégorie par valeur distincte (plusieurs sous-réseaux partagent une AZ) ; None : adresse hors
+            # de tout préfixe connu
+            values = [entry[attribute] for entry in index["entries"]] + [None]
+            distinct = list(dict.fromkeys(values))
+            codes = np.array([distinct.index(value) for value in values], dtype=np.int32)
+            columns[f"{field[:3]}-{suffix}"] = codes[entries]
+            categories[f"{field[:3]}-{suffix}"] = np.array(distinct, dtype=object)
+
+    return {"size": table["size"], "columns": columns, "categories": categories}
@@ -0,0 +1,62 @@
+import hashlib
+
+
+# Limites CloudFormation sur la taille d'un template
+MAX_TEMPLATE_BODY = 51200
+MAX_TEMPLATE_URL = 1024 * 1024
+
+
+def render_body(template):
+    # JSON minifié, ou YAML s'il est plus court : chaque octet compte sous la limite de TemplateBody
+    compact_json = template.to_json(indent=None, separators=(",", ":"))
+    yaml_body = template.to_yaml()
+    if len(yaml_body.encode("utf-8")) < len(compact_json.encode("utf-8")):
+        return yaml_body
+    return compact_json
+
+
+def template_source(stack_name, body, s3_client=None, staging_bucket=None):
+    # Retourne les arguments TemplateBody ou TemplateURL à passer à create_stack / create_change_set
+    size = len(body.encode("utf-8"))
+    if size <= MAX_TEMPLATE_BODY:
+        return {"TemplateBody": body}
+
+    if size > MAX_TEMPLATE_URL:
+        raise ValueError(f"Template de {stack_name} trop gros ({size} octets), même via S3")
+    if s3_client is None or staging_bucket is None:
+        raise ValueError(
+            f"Template de {stack_name} trop gros pour TemplateBody ({size} octets) : "
+            "un bucket de staging est nécessaire"
+        )
+
+    key = staging_key(stack_name, body)
+    upload(s3_client, staging_bucket, key, body)
+    print(f"Template de {stack_name} ({size} octets) téléversé dans s3://{staging_bucket}/{key}")
+    return {"TemplateURL": staging_url(s3_client, staging_bucket, key)}
+
+
+def staging_key(stack_name, body):
+    # Clé dérivée du contenu : les versions successives d'un template ne s'écrasent pas
+    digest = hashlib.sha256(body.encode("utf-8")).hexdigest()
+    extension = "json" if body.startswith("{") else "yaml"
+    return f"templates/{stack_name}/{digest}.{extension}"
+
+
+def staging_url(s3_client, staging_bucket, key):
+    return f"https://{staging_bucket}.s3.{s3_client.meta.region_name}.amazonaws.com/{key}"
+
+
+def upload(s3_client, staging_bucket, key, body):
+    s3_client.put_object(Bucket=staging_bucket, Key=key, Body=body.encode("utf-8"))
+
+
+def nested_template_url(s3_client, staging_bucket, stack_name):
+    # URL des stacks imbriquées de stack_name, connue avant le téléversement puisqu'elle dérive du contenu
+    def template_url(nested_name, body):
+        return staging_url(s3_client, staging_bucket, staging_key(f"{stack_name}/{nested_name}", body))
+    return template_url
+
+
+def upload_nested(s3_client, staging_bucket, stack_name, bodies):
+    for nested_name, body in bodies.items():
+        upload(s3_client, staging_bucket, staging_key(f"{stack_name}/{nested_name}", body), body)
@@ -0,0 +1,32 @@
+import datetime
+
+import flow_ingest
+
+
+class _Paginator:
+    def paginate(self, **kwargs):
+        return [{"Contents": []}]
+
+
+class _S3:
+    class meta:
+        region_name = "us-east-1"
+
+    def get_paginator(self, name):
+        return _Paginator()
+
+
+def test_naive_since_is_read_as_utc_after_a_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(flow_ingest, "get_client", lambda service, region=None: _S3())
+    path = str(tmp_path / "checkpoint.json")
+    utc = datetime.timezone.utc
+    # Premier passage la veille : la journée du 17 est fermée, le checkpoint a un closed_before avec fuseau
+    flow_ingest.ingest(
+        lambda key, records: None, account="1", path=path, since=datetime.datetime(2026, 10, 17, tzinfo=utc),
+        now=datetime.datetime(2026, 10, 18, 12, tzinfo=utc),
+    )
+    stats = flow_ingest.ingest(
+        lambda key, records: None, account="1", path=path, since=datetime.datetime(2026, 10, 16),
+        now=datetime.datetime(2026, 10, 18, 13, tzinfo=utc),
+    )
+    assert stats["partitions"] == 1
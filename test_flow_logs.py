@@ -0,0 +1,25 @@
+import threading
+
+import flow_logs
+
+
+def test_custom_format_keeps_service_names_as_strings():
+    lines = iter(["version pkt-src-aws-service dstport", "5 AMAZON 22"])
+    assert list(flow_logs.parse_lines(lines)) == [{"version": 5, "pkt-src-aws-service": "AMAZON", "dstport": 22}]
+
+
+def test_closing_the_consumer_stops_pending_downloads():
+    opened = []
+    lock = threading.Lock()
+
+    def read(item):
+        with lock:
+            opened.append(item)
+        return list(range(10))
+
+    records = flow_logs.fetch_concurrently(read, range(200), max_workers=4)
+    next(records)
+    records.close()
+    # Seuls les objets déjà lus (au plus la taille de la file, 2 * max_workers lots) ou en cours de lecture
+    # (max_workers) sont téléchargés, pas les 200
+    assert len(opened) <= 3 * 4 + 1
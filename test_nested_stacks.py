@@ -0,0 +1,32 @@
+import json
+
+import nested_stacks
+from cloud_watch_3_2 import build_cloudwatch_template
+
+
+def _split(params):
+    with nested_stacks.unbounded_templates():
+        template = build_cloudwatch_template(params)
+    return nested_stacks.split_template(template, lambda name, body: f"https://example.com/{name}.json")
+
+
+def test_split_children_only_reference_local_resources_or_parameters():
+    parent, bodies = _split({"AZCount": 100})
+    assert len(bodies) > 1
+    for name, body in bodies.items():
+        child = json.loads(body)
+        assert not nested_stacks.exceeds_limits(child)
+        known = set(child["Resources"]) | set(child.get("Parameters", {}))
+        found = set()
+        nested_stacks._dependencies(child["Resources"], found)
+        nested_stacks._dependencies(child.get("Outputs", {}), found)
+        assert {target for target in found if not target.startswith("AWS::")} <= known, name
+
+
+def test_parent_passes_exactly_the_child_parameters():
+    parent, bodies = _split({"AZCount": 100})
+    resources = parent.to_dict()["Resources"]
+    assert set(resources) == set(bodies)
+    for name, body in bodies.items():
+        passed = set(resources[name]["Properties"].get("Parameters", {}))
+        assert passed == set(json.loads(body).get("Parameters", {})), name
@@ -0,0 +1,29 @@
+import s3_3_3_2
+
+
+def _resources_selector(params):
+    template = s3_3_3_2.create_s3_template(params).to_dict()
+    selectors = template["Resources"]["CloudTrail"]["Properties"]["AdvancedEventSelectors"]
+    data = next(selector for selector in selectors if selector["Name"] == "S3ObjectDataEvents")
+    return next(field for field in data["FieldSelectors"] if field["Field"] == "resources.ARN")
+
+
+def test_dedicated_log_bucket_excludes_nothing():
+    # Les flow logs VPC sont livrés sous polystudentsbucket/AWSLogs/ : leurs événements restent journalisés
+    for params in ({}, {"TrailLogBucketName": "other-log-bucket"}):
+        selector = _resources_selector(params)
+        assert selector["StartsWith"] == ["arn:aws:s3:::polystudentsbucket/"]
+        assert "NotStartsWith" not in selector
+
+
+def test_source_bucket_as_log_bucket_excludes_only_the_trail_tree():
+    # AWSLogs/<compte>/CloudTrail couvre aussi CloudTrail-Digest, mais pas AWSLogs/<compte>/vpcflowlogs/
+    selector = _resources_selector({"TrailLogBucketName": "polystudentsbucket"})
+    assert selector["NotStartsWith"] == [
+        {"Fn::Sub": "arn:aws:s3:::polystudentsbucket/AWSLogs/${AWS::AccountId}/CloudTrail"}
+    ]
+
+    selector = _resources_selector({"TrailLogBucketName": "polystudentsbucket", "TrailS3KeyPrefix": "trail"})
+    assert selector["NotStartsWith"] == [
+        {"Fn::Sub": "arn:aws:s3:::polystudentsbucket/trail/AWSLogs/${AWS::AccountId}/CloudTrail"}
+    ]
@@ -0,0 +1,66 @@
+import numpy as np
+
+import scan_detector
+from flow_synth import _text_column, generate_columns
+
+
+FIELDS = ("srcaddr", "dstaddr", "dstport", "action", "start")
+
+
+def _columns(records=60000, seed=3, duration=1200):
+    columns = generate_columns(records, seed=seed, duration=duration)
+    return {
+        field: np.array(_text_column(columns[field], field), dtype=object) if field.endswith("addr")
+        else columns[field]
+        for field in FIELDS
+    }
+
+
+def _run(columns, order, **options):
+    detector = scan_detector.new_detector(**options)
+    alerts = []
+    for i in range(0, len(order), 5000):
+        batch = order[i:i + 5000]
+        alerts += scan_detector.update(detector, *(columns[field][batch] for field in FIELDS))
+    return detector, {(alert["kind"], alert["srcaddr"]) for alert in alerts}
+
+
+def test_out_of_order_records_within_lateness_are_kept():
+    columns = _columns()
+    _, expected = _run(columns, np.arange(len(columns["start"])))
+    assert expected
+
+    # Deux moitiés lues l'une après l'autre, puis entrelacées comme le fait flow_logs.fetch_concurrently
+    half = len(columns["start"]) // 2
+    first, second = np.arange(half), np.arange(half, 2 * half)
+    back_to_back = np.concatenate([second, first])
+    interleaved = np.stack([first, second], axis=1).reshape(-1)
+    for order in (back_to_back, interleaved):
+        detector, alerts = _run(columns, order, lateness=1200)
+        assert detector["late"] == 0
+        # L'ordre change un peu les admissions parmi les sources suivies, pas les détections attendues
+        assert expected <= alerts
+
+
+def test_records_older_than_lateness_are_counted():
+    detector = scan_detector.new_detector(window=600, slices=4, lateness=600)
+    scan_detector.update(detector, ["1.2.3.4"], ["10.0.0.10"], [22], ["REJECT"], [1760010000])
+    # Tranche de 150 s : l'anneau couvre 8 tranches, soit 1200 s avant la plus récente
+    scan_detector.update(
+        detector, ["1.2.3.4", "1.2.3.4"], ["10.0.0.10", "10.0.0.10"], [22, 22], ["REJECT", "REJECT"],
+        [1760010000 - 1000, 1760010000 - 1300],
+    )
+    assert detector["late"] == 1
+
+
+def test_late_scan_is_detected_in_its_own_window():
+    detector = scan_detector.new_detector(window=600, slices=4, lateness=3600)
+    scan_detector.update(detector, ["9.9.9.9"], ["10.0.0.10"], [443], ["ACCEPT"], [1760010000])
+    ports = np.arange(1000, 1100)
+    alerts = scan_detector.update(
+        detector, ["8.8.8.8"] * len(ports), ["10.0.0.10"] * len(ports), ports, ["REJECT"] * len(ports),
+        np.full(len(ports), 1760010000 - 3000),
+    )
+    assert [alert["kind"] for alert in alerts] == ["vertical_scan"]
+    assert alerts[0]["window_end"] <= 1760010000 - 3000 + 150
+    assert detector["late"] == 0
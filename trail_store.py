@@ -0,0 +1,206 @@
+import argparse
+import datetime
+import re
+import sqlite3
+import time
+
+import object_cache
+from aws_clients import get_account_id, get_client
+from cloudtrail_logs import (
+    DEFAULT_BUCKET, EVENT_FIELDS, list_objects, partition_prefixes, read_cached_object, read_object,
+    region_prefixes,
+)
+from flow_logs import fetch_concurrently
+
+
+DATABASE_FILE = "cloudtrail_events.sqlite"
+
+# Les fichiers d'une journée arrivent encore quelque temps après minuit : la dernière journée ingérée est
+# relistée à chaque passage, les objets déjà chargés étant ignorés
+RELIST_DAYS = 1
+
+# Index couvrants : chaque requête usuelle est résolue dans l'index seul, sans lire la table
+INDEXES = {
+    "events_by_principal": ("principal", "action", "time", "bucket", "key", "source_ip"),
+    "events_by_key": ("bucket", "key", "time", "principal", "action", "source_ip"),
+    "events_by_action": ("action", "time", "principal", "bucket", "key", "source_ip"),
+    "events_by_time": ("time", "principal", "action", "bucket", "key", "source_ip"),
+}
+
+
+def connect(path=DATABASE_FILE):
+    connection = sqlite3.connect(path)
+    # WAL : les requêtes restent possibles pendant une ingestion
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute(f"CREATE TABLE IF NOT EXISTS events ({', '.join(f'{field} TEXT' for field in EVENT_FIELDS)})")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS objects (key TEXT PRIMARY KEY, etag TEXT, day TEXT, events INTEGER)"
+    )
+    for name, columns in INDEXES.items():
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON events ({', '.join(columns)})")
+    connection.commit()
+    return connection
+
+
+# [<préfixe>/]AWSLogs/<compte>/CloudTrail/<région>/AAAA/MM/JJ/<fichier>
+OBJECT_DAY = re.compile(r"/(\d{4})/(\d{2})/(\d{2})/[^/]+$")
+
+
+def _object_day(key):
+    return "-".join(OBJECT_DAY.search(key).groups())
+
+
+def ingest(connection, bucket=DEFAULT_BUCKET, since=None, account=None, regions=None, region=None, max_workers=8,
+           cache=False, today=None, key_prefix=""):
+    # Charge les fichiers de trail pas encore ingérés. Chaque fichier est inséré avec sa ligne dans "objects"
+    # dans une même transaction : un arrêt brutal ne laisse ni doublon ni fichier à moitié chargé
+    s3_client = get_client("s3", region)
+    if account is None:
+        account = get_account_id(region)
+    if regions is None:
+        regions = list(region_prefixes(s3_client, bucket, account, key_prefix))
+    today = today or datetime.datetime.now(datetime.timezone.utc).date()
+
+    last_day = connection.execute("SELECT MAX(day) FROM objects").fetchone()[0]
+    if last_day is not None:
+        start = datetime.date.fromisoformat(last_day) - datetime.timedelta(days=RELIST_DAYS)
+        start = max(since, start) if since else start
+    else:
+        start = since or today
+
+    loaded = {
+        key for (key,) in connection.execute("SELECT key FROM objects WHERE day >= ?", (start.isoformat(),))
+    }
+    stats = {"objects": 0, "skipped": 0, "events": 0}
+
+    def new_objects():
+        for obj in list_objects(s3_client, bucket, partition_prefixes(account, regions, start, today, key_prefix)):
+            if obj["Key"] in loaded:
+                stats["skipped"] += 1
+            else:
+                yield obj
+
+    def read(obj):
+        if cache:
+            events = read_cached_object(s3_client, bucket, obj["Key"], obj.get("ETag"))
+        else:
+            events = read_object(s3_client, bucket, obj["Key"])
+        return [(obj, list(events))]
+
+    for obj, events in fetch_concurrently(read, new_objects(), max_workers):
+        with connection:
+            connection.executemany(
+                f"INSERT INTO events VALUES ({', '.join('?' * len(EVENT_FIELDS))})", events
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)",
+                (obj["Key"], obj.get("ETag"), _object_day(obj["Key"]), len(events)),
+            )
+        stats["objects"] += 1
+        stats["events"] += len(events)
+
+    if stats["objects"]:
+        # Statistiques (échantillonnées, donc rapides) pour que le planificateur choisisse le bon index
+        connection.execute("PRAGMA analysis_limit=1000")
+        connection.execute("ANALYZE")
+    return stats
+
+
+def _timestamp(value):
+    # eventTime est en UTC au format 2026-10-18T12:00:00Z : les comparaisons de chaînes suivent l'ordre du temps
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    if isinstance(value, datetime.date):
+        return f"{value:%Y-%m-%d}T00:00:00Z"
+    return value
+
+
+def query(connection, principal=None, key_prefix=None, bucket=None, action=None, start=None, end=None,
+          limit=None, principal_prefix=None):
+    # Événements correspondant à tous les critères donnés, du plus récent au plus ancien. Un préfixe devient un
+    # intervalle [préfixe, préfixe suivant) : contrairement à LIKE, il utilise l'index. principal_prefix
+    # (ex. : arn:aws:sts::<compte>:assumed-role/<rôle>/) couvre toutes les sessions d'un rôle
+    conditions, values = [], []
+    for column, value in (("principal", principal), ("bucket", bucket), ("action", action)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            values.append(value)
+    for column, prefix in (("principal", principal_prefix), ("key", key_prefix)):
+        if prefix:
+            conditions.append(f"{column} >= ? AND {column} < ?")
+            values += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+    if start is not None:
+        conditions.append("time >= ?")
+        values.append(_timestamp(start))
+    if end is not None:
+        conditions.append("time < ?")
+        values.append(_timestamp(end))
+
+    sql = f"SELECT {', '.join(EVENT_FIELDS)} FROM events"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY time DESC"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return connection.execute(sql, values).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Base locale indexée des événements CloudTrail S3")
+    parser.add_argument("--database", default=DATABASE_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="Charge les nouveaux fichiers du trail")
+    ingest_parser.add_argument("--bucket", default=DEFAULT_BUCKET)
+    ingest_parser.add_argument("--key-prefix", default="", help="S3KeyPrefix du trail (TrailS3KeyPrefix)")
+    ingest_parser.add_argument("--account")
+    ingest_parser.add_argument("--region", help="Région du client S3")
+    ingest_parser.add_argument("--regions", nargs="+", help="Régions du trail (par défaut : toutes celles livrées)")
+    ingest_parser.add_argument(
+        "--since", type=datetime.date.fromisoformat,
+        help="Premier jour au premier passage ; ensuite, la base reprend après le dernier jour chargé",
+    )
+    ingest_parser.add_argument("--max-workers", type=int, default=8)
+    ingest_parser.add_argument(
+        "--cache", action="store_true", help=f"Copie locale des objets dans {object_cache.CACHE_DIR}"
+    )
+
+    query_parser = commands.add_parser("query", help="Recherche d'événements")
+    query_parser.add_argument("--principal")
+    query_parser.add_argument("--principal-prefix", help="Ex. : toutes les sessions d'un rôle")
+    query_parser.add_argument("--key-prefix")
+    query_parser.add_argument("--bucket")
+    query_parser.add_argument("--action")
+    query_parser.add_argument("--start", type=datetime.datetime.fromisoformat)
+    query_parser.add_argument("--end", type=datetime.datetime.fromisoformat)
+    query_parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    connection = connect(args.database)
+    try:
+        if args.command == "ingest":
+            stats = ingest(
+                connection, args.bucket, args.since, args.account, args.regions, args.region, args.max_workers,
+                args.cache, key_prefix=args.key_prefix,
+            )
+            print(f"{stats['objects']} nouveaux fichiers ({stats['events']} événements), "
+                  f"{stats['skipped']} déjà chargés")
+        else:
+            started = time.perf_counter()
+            rows = query(
+                connection, args.principal, args.key_prefix, args.bucket, args.action, args.start, args.end,
+                args.limit, args.principal_prefix,
+            )
+            elapsed = time.perf_counter() - started
+            for row in rows:
+                print(" ".join(str(value) for value in row))
+            print(f"{len(rows)} événements en {elapsed * 1000:.1f} ms")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
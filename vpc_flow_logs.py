@@ -1,454 +1,283 @@
-import boto3
-from troposphere import Template, Ref, Tags, Join, Sub, Select, GetAZs, GetAtt, Parameter, Output
-from troposphere.ec2 import (
-    VPC,
-    Subnet,
-    RouteTable,
-    InternetGateway,
-    VPCGatewayAttachment,
-    NatGateway,
-    EIP,
-    Route,
-    SubnetRouteTableAssociation,
-    SecurityGroup,
-    SecurityGroupRule
-)
-
-from troposphere.ec2 import FlowLog
+from troposphere import Template, Ref, Tags, Sub, GetAtt, Parameter, Output
+from troposphere.cloudwatch import Alarm
+from troposphere.ec2 import FlowLog, DestinationOptions
+from troposphere.iam import Role, Policy
+from troposphere.logs import LogGroup, MetricFilter, MetricTransformation
 from troposphere.s3 import BucketPolicy
 
+from aws_clients import get_client
+from deploy_cache import deploy_if_changed
+from network import add_network
 
-# Créer un template Troposphere
-template = Template()
-template.set_description("CloudFormation template generated via Troposphere")
 
-############ Paramètres ############
+# Stack déployée par ce script ; deploy_all.STACKS reprend ce nom
+STACK_NAME = "PolyFlowLogsStack"
 
-environment_name = template.add_parameter(
-    Parameter(
-        "EnvironmentName",
-        Type="String",
-        Description="Environment is prefixed to resource names",
-        Default="PolyEnvironment"
-    )
-)
-
-vpc_cidr = template.add_parameter(
-    Parameter(
-        "VpcCIDR",
-        Description="VPC polystudent-vpc",
-        Type="String",
-        Default="10.0.0.0/16"
-    )
-)
-
-public_subnet1_cidr = template.add_parameter(
-    Parameter(
-        "PublicSubnet1CIDR",
-        Description="public subnet in Availability Zone 1",
-        Type="String",
-        Default="10.0.0.0/24"
-    )
-)
-
-public_subnet2_cidr = template.add_parameter(
-    Parameter(
-        "PublicSubnet2CIDR",
-        Description="Public Subnet in availability zone 2",
-        Type="String",
-        Default="10.0.16.0/24"
-    )
-)
 
-private_subnet1_cidr = template.add_parameter(
-    Parameter(
-        "PrivateSubnet1CIDR",
-        Description="Private Subnet in availability zone 1",
-        Type="String",
-        Default="10.0.128.0/24"
-    )
-)
+# archive : livraison dans S3 toutes les 10 minutes (peu coûteux, pour l'historique)
+# low-latency : livraison dans CloudWatch Logs toutes les minutes, avec métrique et alarme sur les rejets
+# both : les deux flow logs côte à côte
+FLOW_LOG_PROFILES = ("archive", "low-latency", "both")
+DEFAULT_FLOW_LOG_PROFILE = "archive"
 
-private_subnet2_cidr = template.add_parameter(
-    Parameter(
-        "PrivateSubnet2CIDR",
-        Description="Private Subnet in availability zone 2",
-        Type="String",
-        Default="10.0.144.0/24"
-    )
-)
+METRIC_NAMESPACE = "PolyStudent/VPCFlowLogs"
 
-s3_bucket_name = template.add_parameter(
-    Parameter(
-        "S3BucketName",
-        Type="String",
-        Description="Name of the S3 bucket for VPC Flow Logs",
-        Default="polystudentsbucket"  # Le nom du bucket créé précédemment
-    )
+# Format par défaut (v2) des flow logs dans CloudWatch Logs : un enregistrement par événement, champs séparés
+# par des espaces
+REJECT_FILTER_PATTERN = (
+    "[version, account_id, interface_id, srcaddr, dstaddr, srcport, dstport, protocol, packets, bytes, "
+    "start, end, action=\"REJECT\", log_status]"
 )
 
-############ Ressources ############
 
-# VPC
-vpc = template.add_resource(
-    VPC(
-        "VPC",
-        CidrBlock=Ref(vpc_cidr),
-        EnableDnsSupport=True,
-        EnableDnsHostnames=True,
-        Tags=Tags(Name=Ref(environment_name)),
-    )
-)
+def flow_log_profile(params):
+    profile = params.get("FlowLogProfile", DEFAULT_FLOW_LOG_PROFILE)
+    if profile not in FLOW_LOG_PROFILES:
+        raise ValueError(f"FlowLogProfile doit être l'un de {', '.join(FLOW_LOG_PROFILES)}")
+    return profile
 
 
-vpc_flow_log = template.add_resource(
-    FlowLog(
-        "VPCFlowLog",
-        # Supprimer la ligne DeliverLogsPermissionArn
-        LogDestination=Sub("arn:aws:s3:::${S3BucketName}"),
-        LogDestinationType="s3",
-        ResourceId=Ref(vpc),
-        ResourceType="VPC",
-        TrafficType="REJECT",
-        MaxAggregationInterval=600,
-        Tags=Tags(
-            Name=Sub("${EnvironmentName}-flow-logs")
+def add_low_latency_flow_log(template, params, vpc):
+    # Flow log agrégé sur 60 s vers CloudWatch Logs : un filtre de métrique compte les paquets rejetés et une
+    # alarme se déclenche dès la première minute anormale, au lieu d'attendre la livraison S3
+    retention = template.add_parameter(
+        Parameter(
+            "FlowLogRetentionDays",
+            Type="Number",
+            Description="Retention of the low-latency flow log group, in days",
+            Default=params.get("FlowLogRetentionDays", 7)
         )
     )
-)
-
-bucket_policy = template.add_resource(
-    BucketPolicy(
-        "S3BucketPolicy",
-        Bucket=Ref(s3_bucket_name),  # Référence au nom du bucket
-        PolicyDocument={
-            "Version": "2012-10-17",
-            "Statement": [{
-                "Sid": "AWSVPCFlowLogs",
-                "Effect": "Allow",
-                "Principal": {
-                    "Service": "delivery.logs.amazonaws.com"
-                },
-                "Action": "s3:PutObject",
-                "Resource": Sub("arn:aws:s3:::${S3BucketName}/*"),
-                "Condition": {
-                    "StringEquals": {
-                        "s3:x-amz-acl": "bucket-owner-full-control"
-                    }
-                }
-            }]
-        }
-    )
-)
-
-# Internet Gateway
-internet_gateway = template.add_resource(
-    InternetGateway(
-        "InternetGateway",
-        Tags=Tags(Name=Ref(environment_name))
-    )
-)
-
-gateway_attachment = template.add_resource(
-    VPCGatewayAttachment(
-        "InternetGatewayAttachment",
-        VpcId=Ref(vpc),
-        InternetGatewayId=Ref(internet_gateway),
-    )
-)
-
-# Public Subnets
-public_subnet1 = template.add_resource(
-    Subnet(
-        "PublicSubnet1",
-        VpcId=Ref(vpc),
-        AvailabilityZone=Select(0, GetAZs("")),
-        CidrBlock=Ref(public_subnet1_cidr),
-        MapPublicIpOnLaunch=True,
-        Tags=Tags(Name=Sub("${EnvironmentName} Public Subnet (AZ1)")),
-    )
-)
-
-public_subnet2 = template.add_resource(
-    Subnet(
-        "PublicSubnet2",
-        VpcId=Ref(vpc),
-        AvailabilityZone=Select(1, GetAZs("")),
-        CidrBlock=Ref(public_subnet2_cidr),
-        MapPublicIpOnLaunch=True,
-        Tags=Tags(Name=Sub("${EnvironmentName} Public Subnet (AZ2)")),
-    )
-)
-
-# Private Subnets
-private_subnet1 = template.add_resource(
-    Subnet(
-        "PrivateSubnet1",
-        VpcId=Ref(vpc),
-        AvailabilityZone=Select(0, GetAZs("")),
-        CidrBlock=Ref(private_subnet1_cidr),
-        MapPublicIpOnLaunch=False,
-        Tags=Tags(Name=Sub("${EnvironmentName} Private Subnet (AZ1)")),
-    )
-)
-
-private_subnet2 = template.add_resource(
-    Subnet(
-        "PrivateSubnet2",
-        VpcId=Ref(vpc),
-        AvailabilityZone=Select(1, GetAZs("")),
-        CidrBlock=Ref(private_subnet2_cidr),
-        MapPublicIpOnLaunch=False,
-        Tags=Tags(Name=Sub("${EnvironmentName} Private Subnet (AZ2)")),
-    )
-)
-
-# Public Route Table
-
-public_route_table = template.add_resource(
-    RouteTable(
-        "PublicRouteTable",
-        VpcId=Ref(vpc),
-        Tags=Tags(Name=Sub("${EnvironmentName} Public Routes"))
-    )
-)
-
-# Nat Gateways
-
-nat_gateway_eip1 = template.add_resource(
-    EIP(
-        "NatGateway1EIP",
-        DependsOn="InternetGatewayAttachment",
-        Domain="vpc"
-    )
-)
 
-nat_gateway_eip2 = template.add_resource(
-    EIP(
-        "NatGateway2EIP",
-        DependsOn="InternetGatewayAttachment",
-        Domain="vpc"
+    threshold = template.add_parameter(
+        Parameter(
+            "RejectedPacketsThreshold",
+            Type="Number",
+            Description="Rejected packets per minute that trigger the alarm",
+            Default=params.get("RejectedPacketsThreshold", 100)
+        )
     )
-)
 
-nat_gateway_1 = template.add_resource(
-    NatGateway(
-        "NatGateway1",
-        AllocationId=GetAtt(nat_gateway_eip1, "AllocationId"),
-        SubnetId=Ref(public_subnet1)
-    )
-)
-
-nat_gateway_2 = template.add_resource(
-    NatGateway(
-        "NatGateway2",
-        AllocationId=GetAtt(nat_gateway_eip2, "AllocationId"),
-        SubnetId=Ref(public_subnet2)
+    log_group = template.add_resource(
+        LogGroup(
+            "VPCFlowLogGroup",
+            RetentionInDays=Ref(retention),
+        )
     )
-)
 
-# Routes
-
-default_public_route = template.add_resource(
-    Route(
-        "DefaultPublicRoute",
-        DependsOn="InternetGatewayAttachment",
-        RouteTableId=Ref(public_route_table),
-        DestinationCidrBlock="0.0.0.0/0",
-        GatewayId=Ref(internet_gateway)
+    delivery_role = template.add_resource(
+        Role(
+            "VPCFlowLogDeliveryRole",
+            AssumeRolePolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [{
+                    "Effect": "Allow",
+                    "Principal": {"Service": "vpc-flow-logs.amazonaws.com"},
+                    "Action": "sts:AssumeRole",
+                    "Condition": {"StringEquals": {"aws:SourceAccount": Ref("AWS::AccountId")}}
+                }]
+            },
+            Policies=[
+                Policy(
+                    PolicyName="VPCFlowLogDelivery",
+                    PolicyDocument={
+                        "Version": "2012-10-17",
+                        "Statement": [{
+                            "Effect": "Allow",
+                            "Action": [
+                                "logs:CreateLogStream",
+                                "logs:PutLogEvents",
+                                "logs:DescribeLogGroups",
+                                "logs:DescribeLogStreams"
+                            ],
+                            "Resource": [GetAtt(log_group, "Arn"), Sub("${VPCFlowLogGroup.Arn}:*")]
+                        }]
+                    }
+                )
+            ]
+        )
     )
-)
 
-public_subnet1_route_table_association = template.add_resource(
-    SubnetRouteTableAssociation(
-        "PublicSubnet1RouteTableAssociation",
-        RouteTableId=Ref(public_route_table),
-        SubnetId=Ref(public_subnet1)
+    flow_log = template.add_resource(
+        FlowLog(
+            "VPCFlowLogCloudWatch",
+            LogDestinationType="cloud-watch-logs",
+            LogGroupName=Ref(log_group),
+            DeliverLogsPermissionArn=GetAtt(delivery_role, "Arn"),
+            ResourceId=Ref(vpc),
+            ResourceType="VPC",
+            TrafficType="REJECT",
+            MaxAggregationInterval=60,
+            Tags=Tags(
+                Name=Sub("${EnvironmentName}-flow-logs-low-latency")
+            )
+        )
     )
-)
 
-public_subnet2_route_table_association = template.add_resource(
-    SubnetRouteTableAssociation(
-        "PublicSubnet2RouteTableAssociation",
-        RouteTableId=Ref(public_route_table),
-        SubnetId=Ref(public_subnet2)
+    template.add_resource(
+        MetricFilter(
+            "RejectedPacketsMetricFilter",
+            LogGroupName=Ref(log_group),
+            FilterPattern=REJECT_FILTER_PATTERN,
+            MetricTransformations=[
+                MetricTransformation(
+                    MetricNamespace=METRIC_NAMESPACE,
+                    MetricName="RejectedPackets",
+                    MetricValue="$packets",
+                    DefaultValue=0,
+                )
+            ]
+        )
     )
-)
 
-private_route_table1 = template.add_resource(
-    RouteTable(
-        "PrivateRouteTable1",
-        VpcId=Ref(vpc),
-        Tags=Tags(Name=Sub("${EnvironmentName} Private Routes (AZ1)"))
+    alarm = template.add_resource(
+        Alarm(
+            "RejectedPacketsAlarm",
+            AlarmDescription="Rejected packets in the VPC exceed the threshold within one minute",
+            Namespace=METRIC_NAMESPACE,
+            MetricName="RejectedPackets",
+            Statistic="Sum",
+            Period=60,
+            EvaluationPeriods=1,
+            Threshold=Ref(threshold),
+            ComparisonOperator="GreaterThanThreshold",
+            TreatMissingData="notBreaching",
+        )
     )
-)
+    if params.get("FlowLogAlarmTopicArn"):
+        alarm.AlarmActions = [params["FlowLogAlarmTopicArn"]]
 
-default_private_route1 = template.add_resource(
-    Route(
-        "DefaultPrivateRoute1",
-        RouteTableId=Ref(private_route_table1),
-        DestinationCidrBlock="0.0.0.0/0",
-        NatGatewayId=Ref(nat_gateway_1)
+    template.add_output(
+        Output(
+            "VPCFlowLogCloudWatchId",
+            Description="ID of the low-latency VPC Flow Log",
+            Value=Ref(flow_log)
+        )
     )
-)
 
-private_subnet1_route_table_association = template.add_resource(
-    SubnetRouteTableAssociation(
-        "PrivateSubnet1RouteTableAssociation",
-        RouteTableId=Ref(private_route_table1),
-        SubnetId=Ref(private_subnet1)
+    template.add_output(
+        Output(
+            "VPCFlowLogGroupName",
+            Description="CloudWatch Logs group of the low-latency VPC Flow Log",
+            Value=Ref(log_group)
+        )
     )
-)
 
-private_route_table2 = template.add_resource(
-    RouteTable(
-        "PrivateRouteTable2",
-        VpcId=Ref(vpc),
-        Tags=Tags(Name=Sub("${EnvironmentName} Private Routes (AZ2)"))
-    )
-)
 
-default_private_route2 = template.add_resource(
-    Route(
-        "DefaultPrivateRoute2",
-        RouteTableId=Ref(private_route_table2),
-        DestinationCidrBlock="0.0.0.0/0",
-        NatGatewayId=Ref(nat_gateway_2)
+def add_archive_flow_log(template, params, vpc, s3_bucket_name):
+    # Flow log livré dans S3 toutes les 10 minutes, pour l'archivage à bas coût
+    vpc_flow_log = template.add_resource(
+        FlowLog(
+            "VPCFlowLog",
+            # Supprimer la ligne DeliverLogsPermissionArn
+            LogDestination=Sub("arn:aws:s3:::${S3BucketName}"),
+            LogDestinationType="s3",
+            ResourceId=Ref(vpc),
+            ResourceType="VPC",
+            TrafficType="REJECT",
+            MaxAggregationInterval=600,
+            Tags=Tags(
+                Name=Sub("${EnvironmentName}-flow-logs")
+            )
+        )
     )
-)
 
-private_subnet2_route_table_association = template.add_resource(
-    SubnetRouteTableAssociation(
-        "PrivateSubnet2RouteTableAssociation",
-        RouteTableId=Ref(private_route_table2),
-        SubnetId=Ref(private_subnet2)
-    )
-)
+    # Parquet et partitions Hive / par heure : le lecteur ne lit alors que les colonnes et heures utiles
+    file_format = params.get("FlowLogFileFormat", "plain-text")
+    hive_partitions = params.get("FlowLogHivePartitions", False)
+    per_hour_partition = params.get("FlowLogPerHourPartition", False)
+    if file_format != "plain-text" or hive_partitions or per_hour_partition:
+        vpc_flow_log.DestinationOptions = DestinationOptions(
+            FileFormat=file_format,
+            HiveCompatiblePartitions=hive_partitions,
+            PerHourPartition=per_hour_partition,
+        )
 
-# Security Group
-
-ingress_rules = [
-    {"IpProtocol": "tcp", "FromPort": 22, "ToPort": 22, "CidrIp": "0.0.0.0/0"},
-    {"IpProtocol": "tcp", "FromPort": 80, "ToPort": 80, "CidrIp": "0.0.0.0/0"},
-    {"IpProtocol": "tcp", "FromPort": 443, "ToPort": 443, "CidrIp": "0.0.0.0/0"},
-    {"IpProtocol": "tcp", "FromPort": 53, "ToPort": 53, "CidrIp": "0.0.0.0/0"},
-    {"IpProtocol": "udp", "FromPort": 53, "ToPort": 53, "CidrIp": "0.0.0.0/0"},
-    {"IpProtocol": "tcp", "FromPort": 1433, "ToPort": 1433, "CidrIp": "0.0.0.0/0"},
-    {"IpProtocol": "tcp", "FromPort": 5432, "ToPort": 5432, "CidrIp": "0.0.0.0/0"},
-    {"IpProtocol": "tcp", "FromPort": 3306, "ToPort": 3306, "CidrIp": "0.0.0.0/0"},
-    {"IpProtocol": "tcp", "FromPort": 3389, "ToPort": 3389, "CidrIp": "0.0.0.0/0"},
-    {"IpProtocol": "tcp", "FromPort": 1514, "ToPort": 1514, "CidrIp": "0.0.0.0/0"},
-    {"IpProtocol": "tcp", "FromPort": 9200, "ToPort": 9300, "CidrIp": "0.0.0.0/0"}
-]
-
-security_group = template.add_resource(
-    SecurityGroup(
-        "IngressSecurityGroup",
-        GroupDescription="Security group allows SSH, HTTP, HTTPS, MSSQL, DNS, PostgreSQL, MySQL, RDP, OSSEC and ElasticSearch",
-        GroupName="polystudent-sg",
-        VpcId=Ref(vpc),
-        SecurityGroupIngress=[SecurityGroupRule(**rule) for rule in ingress_rules]
-        
+    bucket_policy = template.add_resource(
+        BucketPolicy(
+            "S3BucketPolicy",
+            Bucket=Ref(s3_bucket_name),  # Référence au nom du bucket
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [{
+                    "Sid": "AWSVPCFlowLogs",
+                    "Effect": "Allow",
+                    "Principal": {
+                        "Service": "delivery.logs.amazonaws.com"
+                    },
+                    "Action": "s3:PutObject",
+                    "Resource": Sub("arn:aws:s3:::${S3BucketName}/*"),
+                    "Condition": {
+                        "StringEquals": {
+                            "s3:x-amz-acl": "bucket-owner-full-control"
+                        }
+                    }
+                }]
+            }
+        )
     )
-)
-
-############ OUTPUT ############
 
-# VPC Output
-template.add_output(
-    Output(
-        "VPC",
-        Description="A reference to the created VPC",
-        Value=Ref(vpc)
+    template.add_output(
+        Output(
+            "VPCFlowLogId",
+            Description="ID of the VPC Flow Log",
+            Value=Ref(vpc_flow_log)
+        )
     )
-)
 
-# Public Subnets Output
-template.add_output(
-    Output(
-        "PublicSubnets",
-        Description="A list of the public subnets",
-        Value=Join(",", [Ref("PublicSubnet1"), Ref("PublicSubnet2")])
-    )
-)
 
-# Private Subnets Output
-template.add_output(
-    Output(
-        "PrivateSubnets",
-        Description="A list of the private subnets",
-        Value=Join(",", [Ref(private_subnet1), Ref(private_subnet2)])
-    )
-)
+def build_flow_logs_template(params=None):
+    params = params or {}
+    profile = flow_log_profile(params)
 
-# Public Subnet 1 Output
-template.add_output(
-    Output(
-        "PublicSubnet1",
-        Description="A reference to the public subnet in Availability Zone 1",
-        Value=Ref(public_subnet1)
-    )
-)
+    # Créer un template Troposphere
+    template = Template()
+    template.set_description("CloudFormation template generated via Troposphere")
 
-# Public Subnet 2 Output
-template.add_output(
-    Output(
-        "PublicSubnet2",
-        Description="A reference to the public subnet in Availability Zone 2",
-        Value=Ref(public_subnet2)
-    )
-)
+    ############ Paramètres ############
 
-# Private Subnet 1 Output
-template.add_output(
-    Output(
-        "PrivateSubnet1",
-        Description="A reference to the private subnet in Availability Zone 1",
-        Value=Ref(private_subnet1)
-    )
-)
+    if profile != "low-latency":
+        s3_bucket_name = template.add_parameter(
+            Parameter(
+                "S3BucketName",
+                Type="String",
+                Description="Name of the S3 bucket for VPC Flow Logs",
+                Default=params.get("S3BucketName", "polystudentsbucket")  # Le nom du bucket créé précédemment
+            )
+        )
 
-# Private Subnet 2 Output
-template.add_output(
-    Output(
-        "PrivateSubnet2",
-        Description="A reference to the private subnet in Availability Zone 2",
-        Value=Ref(private_subnet2)
-    )
-)
+    ############ Ressources ############
 
-template.add_output(
-    Output(
-        "VPCFlowLogId",
-        Description="ID of the VPC Flow Log",
-        Value=Ref(vpc_flow_log)
-    )
-)
+    # VPC, sous-réseaux, NAT gateways, routes et groupe de sécurité partagés
+    network = add_network(template, params)
+    vpc = network["vpc"]
 
+    if profile != "low-latency":
+        add_archive_flow_log(template, params, vpc, s3_bucket_name)
+    if profile != "archive":
+        add_low_latency_flow_log(template, params, vpc)
 
-############ boto3 ############
+    return template
 
-with open('vpc_logs.yml', 'w') as f:
-    f.write(template.to_yaml())
 
-print("Template yml bien généré dans le fichier")
+def deploy_template(template=None, params=None):
+    if template is None:
+        template = build_flow_logs_template(params)
 
+    cloudformation = get_client('cloudformation')
+    stack_name = STACK_NAME
 
-with open('vpc_logs.yml', 'r') as template:
-    template_body = template.read()
+    # Ne crée ou ne met à jour la stack que si le template a changé. Le profil low-latency crée un rôle IAM
+    action = deploy_if_changed(cloudformation, stack_name, template, capabilities=["CAPABILITY_IAM"])
+    print("Stack deployment:", action)
 
 
-access_key = 'your_access_key'
-secret_key = 'your_secret_key'
-region = 'your_region'
+if __name__ == "__main__":
+    template = build_flow_logs_template()
 
-cloudformation = boto3.client('cloudformation', aws_access_key_id=access_key, aws_secret_access_key=secret_key, region_name=region)
-stack_name = 'PolyStack'
+    with open('vpc_logs.yml', 'w') as f:
+        f.write(template.to_yaml())
 
+    print("Template yml bien généré dans le fichier")
 
-# Essayer de créer une nouvelle stack
-response = cloudformation.create_stack(
-    StackName=stack_name,
-    TemplateBody=template_body,
-)
-print("Stack creation initiated:", response)
\ No newline at end of file
+    deploy_template(template)